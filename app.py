@@ -1,10 +1,12 @@
+import threading
 import streamlit as st
-import matplotlib.pyplot as plt
-from sklearn.decomposition import PCA
-from matplotlib.lines import Line2D
-from data_processing import carregar_dados
-from ml_models import treinar_modelo, gerar_grafico_cotovelo, gerar_grafico_silhueta
-from recommender import gerar_relatorio, recomendar_filmes, obter_detalhes_cluster, gerar_descricao_cluster
+import instrumentacao
+from data_processing import carregar_dados, carregar_matrizes, anexar_filmes
+from ml_models import gerar_grafico_cotovelo, gerar_grafico_silhueta, comparar_motores, calcular_projecao, gerar_mapa_clusters, MOTORES
+from artefatos import carregar_ou_treinar
+from indice_avaliacoes import construir_indice_avaliacoes
+from vizinhos import construir_indice_vizinhos
+from recommender import gerar_relatorio, recomendar_filmes_indexado, recomendar_com_vizinhos, obter_detalhes_cluster, gerar_descricao_cluster, resumir_clusters
 
 
 # CONFIGURAÇÃO DA PÁGINA 
@@ -14,6 +16,11 @@ st.set_page_config(
     page_icon="🎬"
 )
 
+# INSTRUMENTAÇÃO (só com RECOMENDACAO_INSTRUMENTACAO=1): perfil por amostragem de uma execução
+perfil_execucao = None
+if instrumentacao.ATIVA and st.session_state.pop('perfilar_execucao', False):
+    perfil_execucao = instrumentacao.AmostradorPerfil(threads=[threading.get_ident()]).iniciar()
+
 # CONFIGURAÇÃO DE CORES (25 CLUSTERS) 
 PALETA_CLUSTERS = {
     0: '#636EFA',  # Azul
@@ -51,10 +58,19 @@ st.title("🎬 Sistema de Recomendação com K-Means")
 # MENU LATERAL 
 st.sidebar.header("⚙️ Painel de Controle")
 num_clusters = st.sidebar.slider("Quantidade de clusters (K)", min_value=1, max_value=25, value=5)
+motor_treino = st.sidebar.selectbox(
+    "Motor de treinamento", MOTORES,
+    help="'minibatch' e 'incremental' treinam em lotes de usuários: bem mais rápidos em bases grandes, com inércia um pouco maior."
+)
 
 with st.spinner(f"Agrupando usuários em {num_clusters} clusters..."):
     movies, ratings, tabela_completa, tabela_proporcao = carregar_dados()
-    modelo, df_clusters = treinar_modelo(tabela_proporcao, k=num_clusters)
+    # Modelo + índice de recomendação vêm dos artefatos em disco (memory-map); se ainda não
+    # existirem, treina partindo do modelo com o K mais próximo e grava para os próximos processos
+    modelo, df_clusters, indice_recomendacao = carregar_ou_treinar(
+        num_clusters, motor_treino, tabela_proporcao, tabela_completa, movies
+    )
+    indice_avaliacoes = construir_indice_avaliacoes(ratings, movies)
 
 lista_usuarios = df_clusters.index.tolist()
 usuario_selecionado = st.sidebar.selectbox("Escolha o ID do Usuário:", lista_usuarios)
@@ -79,7 +95,7 @@ if aba_selecionada == "👤 Perfil do Usuário":
     st.header(f"Dados Pessoais - Usuário {usuario_selecionado}")
     st.info(f"🧠 O **K-Means** classificou este usuário no **cluster {cluster_atual}**.")
     
-    total_f, media_n, generos_top, top_filmes = gerar_relatorio(usuario_selecionado, ratings, movies)
+    total_f, media_n, generos_top, top_filmes = gerar_relatorio(usuario_selecionado, ratings, movies, indice_avaliacoes)
     
     col1, col2 = st.columns(2)
     col1.metric("🎬 Total de Filmes", total_f)
@@ -146,10 +162,13 @@ elif aba_selecionada == "🌐 Todos os Clusters":
     st.write("Resumo do agrupamento gerado pelo modelo K-Means para toda a base de usuários.")
     st.markdown("---")
     
+    # Resumo de todos os clusters calculado de uma vez (e guardado em cache junto com o modelo)
+    resumo_clusters = resumir_clusters(df_clusters, ratings, k=num_clusters)
+    
     # Passa por todos os clusters criados e gera um item de lista limpo para cada um
-    for i in range(num_clusters):
-        qtd_us, top_gens_c, med_filmes_c = obter_detalhes_cluster(i, df_clusters, ratings)
-        titulo_persona, descricao_persona = gerar_descricao_cluster(top_gens_c)
+    for i, resumo in resumo_clusters.iterrows():
+        qtd_us, top_gens_c = resumo['populacao'], resumo['top_generos']
+        titulo_persona, descricao_persona = resumo['persona'], resumo['descricao']
         
         st.subheader(f"Cluster {i}: {titulo_persona}")
         
@@ -173,32 +192,15 @@ elif aba_selecionada == "📊 Gráficos":
     st.subheader("📍 Mapa de Clusters 2D (PCA)")
     st.write("Visão plana de como os clusters se dividem.")
         
-    pca = PCA(n_components=2)
-    dados_pca = df_clusters.drop(columns=['Cluster'])
-    componentes = pca.fit_transform(dados_pca)
+    modo_mapa = st.radio("Modo de desenho", ["Amostra por cluster", "Densidade"], horizontal=True)
     
-    fig, ax = plt.subplots(figsize=(5, 3))
-        
-    cores_pontos = df_clusters['Cluster'].map(PALETA_CLUSTERS)
-        
-    ax.scatter(componentes[:, 0], componentes[:, 1], c=cores_pontos, alpha=0.5)
-        
+    # Projeção calculada uma vez por modelo; no modo amostra o desenho respeita um orçamento de pontos
+    componentes = calcular_projecao(df_clusters)
     idx = df_clusters.index.get_loc(usuario_selecionado)
-    ax.scatter(componentes[idx, 0], componentes[idx, 1], c=COR_ALVO, s=150, edgecolors='black', marker='.', zorder=5)
-        
-    ax.set_xlabel('Gostos Majoritários', fontsize=10)
-    ax.set_ylabel('Gostos Secundários', fontsize=10)
-    ax.grid(True, linestyle='--', alpha=0.3)
-        
-    elementos_legenda = [Line2D([0], [0], marker='o', color='w', label=f'cluster {i}', 
-                                markerfacecolor=PALETA_CLUSTERS[i], markersize=8) 
-                            for i in range(num_clusters)]
-                             
-    elementos_legenda.append(Line2D([0], [0], marker='.', color='w', label='Usuário Alvo', 
-                                    markerfacecolor=COR_ALVO, markersize=15, markeredgecolor='black'))
-        
-    ax.legend(handles=elementos_legenda, title="clusters", loc='center left', bbox_to_anchor=(1, 0.5), fontsize='small')
-    fig.tight_layout()
+    fig = gerar_mapa_clusters(
+        componentes, df_clusters['Cluster'].to_numpy(), idx, PALETA_CLUSTERS, COR_ALVO,
+        modo='densidade' if modo_mapa == "Densidade" else 'amostra'
+    )
     st.pyplot(fig, use_container_width=False)
 
     st.markdown("---")
@@ -224,6 +226,13 @@ elif aba_selecionada == "📊 Gráficos":
         st.pyplot(fig_silhueta)
         st.success("💡 Quanto mais próximo de 1.0, melhor a definição e separação dos clusters.")
 
+    with st.expander("⏱️ Comparar motores de treinamento (tempo x qualidade)"):
+        if st.button("Executar comparação"):
+            with st.spinner("Treinando com cada motor..."):
+                comparacao = comparar_motores(tabela_proporcao, num_clusters)
+            st.dataframe(comparacao, use_container_width=True)
+            st.info("💡 Inércia relativa = inércia do motor / inércia do K-Means completo (1.0 = mesma qualidade).")
+
 # ABA 5: RECOMENDAÇÕES (REATIVO)
 elif aba_selecionada == "🍿 Recomendações":
     st.header("🍿 Recomendações para usuário - ID: " + str(usuario_selecionado))
@@ -233,10 +242,21 @@ elif aba_selecionada == "🍿 Recomendações":
     st.markdown("---")
     
    
+    personalizar = st.toggle(
+        "Personalizar com os usuários mais parecidos do cluster",
+        help="Reordena os filmes do cluster pelas notas dos 50 usuários com gostos mais próximos dos deste usuário."
+    )
+   
     with st.spinner('O **K-Means** está analisando os dados do cluster...'):
-        recomendacoes = recomendar_filmes(
-            usuario_selecionado, df_clusters, tabela_completa, movies, top_n=qtd_rec
-        )
+        if personalizar:
+            indice_vizinhos = construir_indice_vizinhos(df_clusters, carregar_matrizes())
+            recomendacoes = recomendar_com_vizinhos(
+                usuario_selecionado, indice_recomendacao, indice_vizinhos, top_n=qtd_rec
+            )
+        else:
+            recomendacoes = recomendar_filmes_indexado(
+                usuario_selecionado, indice_recomendacao, top_n=qtd_rec
+            )
             
         if recomendacoes is not None and not recomendacoes.empty:
             st.dataframe(recomendacoes, use_container_width=True, hide_index=True)
@@ -277,10 +297,10 @@ elif aba_selecionada == "🗄️ Tabela de Dados":
         
         # Filtro por usuário alvo
         if st.checkbox("Mostrar apenas avaliações do Usuário Selecionado", value=True):
-            dados_brutos = tabela_completa[tabela_completa['userId'] == usuario_selecionado]
+            dados_brutos = indice_avaliacoes.avaliacoes_completas(usuario_selecionado)
         else:
             # Mostra uma amostra se a tabela for muito grande para não travar o navegador
-            dados_brutos = tabela_completa.head(1000)
+            dados_brutos = anexar_filmes(tabela_completa.head(1000), movies)
             st.warning("Exibindo as primeiras 1000 linhas por performance.")
 
         # Formatando a exibição
@@ -288,4 +308,19 @@ elif aba_selecionada == "🗄️ Tabela de Dados":
             dados_brutos[['userId', 'movieId', 'title', 'genres', 'rating']], 
             use_container_width=True, 
             hide_index=True
-        )
\ No newline at end of file
+        )
+
+
+# PAINEL DE INSTRUMENTAÇÃO
+if instrumentacao.ATIVA:
+    if perfil_execucao is not None:
+        instrumentacao.guardar_perfil(perfil_execucao.parar(), f"app: {aba_selecionada}")
+
+    with st.sidebar.expander("📈 Instrumentação"):
+        st.button("Perfilar a próxima execução", on_click=lambda: st.session_state.update(perfilar_execucao=True))
+        st.dataframe(instrumentacao.exportar_json(), use_container_width=True)
+        perfis = instrumentacao.listar_perfis()
+        if perfis:
+            st.write(f"Último perfil ({perfis[-1]['nome']}, {perfis[-1]['segundos']:.2f}s):")
+            st.json({'proprias': perfis[-1]['proprias'], 'inclusivas': perfis[-1]['inclusivas']})
+        st.download_button("Baixar métricas (Prometheus)", instrumentacao.exportar_prometheus(), "metricas.txt")
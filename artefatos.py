@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import shutil
+
+import joblib
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from modelo_incremental import treinar_com_origem, ORIGEM_FRIO, ORIGEM_AQUECIDO
+from recommender import construir_indice_recomendacao
+
+# ARTEFATOS DO MODELO EM DISCO
+#
+# Guarda tudo o que o app precisa depois do treino (centróides, cluster de cada
+# usuário, matriz de proporções e o ranking pré-calculado de cada cluster) em
+# arquivos .npy, numa pasta identificada pela versão do formato, pelo checksum
+# dos dados e pelo K. Os .npy são abertos com memory-map somente leitura, então
+# vários processos compartilham as mesmas páginas de memória.
+#
+# O meta.json registra, só como informação, a origem do treino: 'frio' (treino
+# normal) ou 'aquecido' (centróides de outro K que passaram na checagem de inércia
+# de modelo_incremental.py). Artefatos v1 não passaram por essa checagem e ficam
+# em outra pasta, então são treinados de novo.
+#
+#   artefatos/v2/<checksum dos dados>/<motor>_k<K>/
+
+VERSAO_ARTEFATOS = 2
+ORIGENS = (ORIGEM_FRIO, ORIGEM_AQUECIDO)
+RAIZ_ARTEFATOS = 'artefatos'
+_checksums = {}
+
+
+# Checksum do conteúdo de movies.dat + ratings.dat (guardado por tamanho/mtime)
+def checksum_dados(diretorio='DataBase'):
+    arquivos = [os.path.join(diretorio, nome) for nome in ('movies.dat', 'ratings.dat')]
+    assinatura = tuple((os.stat(a).st_size, os.stat(a).st_mtime_ns) for a in arquivos)
+    if _checksums.get(diretorio, (None,))[0] != assinatura:
+        h = hashlib.blake2b(digest_size=16)
+        for arquivo in arquivos:
+            with open(arquivo, 'rb') as f:
+                for bloco in iter(lambda: f.read(1 << 20), b''):
+                    h.update(bloco)
+        _checksums[diretorio] = (assinatura, h.hexdigest())
+    return _checksums[diretorio][1]
+
+
+def pasta_artefatos(diretorio, k, motor='kmeans', raiz=RAIZ_ARTEFATOS):
+    return os.path.join(raiz, f'v{VERSAO_ARTEFATOS}', checksum_dados(diretorio), f'{motor}_k{k}')
+
+
+# Filmes vistos por usuário em formato CSR (offsets + movieIds), com a mesma
+# interface .get() da Series usada por recomendar_filmes_indexado
+class VistosCSR:
+
+    def __init__(self, usuarios, inicio, filmes):
+        self._linha = pd.Index(usuarios)
+        self._inicio = inicio
+        self._filmes = filmes
+
+    def get(self, usuario, padrao=None):
+        linha = self._linha.get_indexer([usuario])[0]
+        if linha < 0:
+            return padrao
+        return self._filmes[self._inicio[linha]:self._inicio[linha + 1]]
+
+
+def salvar_artefatos(modelo, df_clusters, indice, diretorio='DataBase', k=None, motor='kmeans', raiz=RAIZ_ARTEFATOS,
+                     origem=ORIGEM_FRIO):
+    if origem not in ORIGENS:
+        raise ValueError(f"Origem de treino desconhecida: {origem!r} (use uma de {ORIGENS})")
+    k = k if k is not None else len(modelo.cluster_centers_)
+    pasta = pasta_artefatos(diretorio, k, motor, raiz)
+    temporaria = pasta + f'.tmp{os.getpid()}'
+
+    usuarios = df_clusters.index.to_numpy()
+    generos = [g for g in df_clusters.columns if g != 'Cluster']
+
+    # Ranking de todos os clusters concatenado; ranking_inicio[c] marca onde começa o cluster c
+    rankings = [indice['ranking'].get(c) for c in range(k)]
+    tamanhos = [0 if r is None else len(r) for r in rankings]
+    rankings = pd.concat([r for r in rankings if r is not None] or [pd.DataFrame(
+        columns=['movieId', 'nota_media_cluster', 'contagem_avaliacoes'])], ignore_index=True)
+
+    # Filmes vistos alinhados com a ordem de df_clusters
+    vistos = [np.asarray(indice['vistos'].get(u, ()), dtype=np.int32) for u in usuarios]
+
+    arrays = {
+        'centroides': np.asarray(modelo.cluster_centers_, dtype=np.float64),
+        'usuarios': usuarios,
+        'clusters': df_clusters['Cluster'].to_numpy(dtype=np.int32),
+        'proporcao': df_clusters[generos].to_numpy(dtype=np.float64),
+        'ranking_inicio': np.concatenate([[0], np.cumsum(tamanhos)]).astype(np.int64),
+        'ranking_movieId': rankings['movieId'].to_numpy(dtype=np.int32),
+        'ranking_media': rankings['nota_media_cluster'].to_numpy(dtype=np.float64),
+        'ranking_contagem': rankings['contagem_avaliacoes'].to_numpy(dtype=np.int64),
+        'vistos_inicio': np.concatenate([[0], np.cumsum([len(v) for v in vistos])]).astype(np.int64),
+        'vistos_movieId': np.concatenate(vistos) if vistos else np.array([], dtype=np.int32),
+    }
+    try:
+        os.makedirs(temporaria, exist_ok=True)
+        for nome, valores in arrays.items():
+            np.save(os.path.join(temporaria, nome + '.npy'), valores)
+        joblib.dump(modelo, os.path.join(temporaria, 'modelo.joblib'))
+        with open(os.path.join(temporaria, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'versao': VERSAO_ARTEFATOS, 'k': k, 'motor': motor, 'origem': origem,
+                       'generos': generos, 'arrays': list(arrays)}, f)
+
+        shutil.rmtree(pasta, ignore_errors=True)
+        os.makedirs(os.path.dirname(pasta), exist_ok=True)
+        os.replace(temporaria, pasta)
+    except OSError:
+        shutil.rmtree(temporaria, ignore_errors=True)
+        return None
+    return pasta
+
+
+# Devolve (modelo, df_clusters, indice) a partir do disco, ou None se não existir
+def carregar_artefatos(df_filmes, diretorio='DataBase', k=5, motor='kmeans', raiz=RAIZ_ARTEFATOS):
+    pasta = pasta_artefatos(diretorio, k, motor, raiz)
+    try:
+        with open(os.path.join(pasta, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        arrays = {nome: np.load(os.path.join(pasta, nome + '.npy'), mmap_mode='r') for nome in meta['arrays']}
+        modelo = joblib.load(os.path.join(pasta, 'modelo.joblib'))
+    except (OSError, ValueError, KeyError):
+        return None
+
+    # DataFrame em cima do memory-map (sem cópia da matriz de proporções)
+    df_clusters = pd.DataFrame(
+        arrays['proporcao'], index=pd.Index(arrays['usuarios'], name='userId'),
+        columns=pd.Index(meta['generos'], name='genres'), copy=False,
+    )
+    df_clusters['Cluster'] = arrays['clusters']
+
+    titulos = df_filmes.set_index('movieId')['title']
+    inicio = arrays['ranking_inicio']
+    ranking = {}
+    for cluster in range(meta['k']):
+        a, b = inicio[cluster], inicio[cluster + 1]
+        if b > a:
+            filmes = arrays['ranking_movieId'][a:b]
+            ranking[cluster] = pd.DataFrame({
+                'movieId': filmes,
+                'title': titulos.reindex(filmes).reset_index(drop=True),
+                'nota_media_cluster': arrays['ranking_media'][a:b],
+                'contagem_avaliacoes': arrays['ranking_contagem'][a:b],
+            })
+
+    indice = {
+        'cluster_do_usuario': df_clusters['Cluster'],
+        'ranking': ranking,
+        'vistos': VistosCSR(arrays['usuarios'], arrays['vistos_inicio'], arrays['vistos_movieId']),
+        'filmes': df_filmes,
+    }
+    return modelo, df_clusters, indice
+
+
+# Carrega do disco; se não houver artefato para (dados, K, motor), treina e grava
+@st.cache_resource
+def carregar_ou_treinar(k, motor, _tabela_proporcao, _tabela_completa, _df_filmes, diretorio='DataBase', raiz=RAIZ_ARTEFATOS):
+    artefatos = carregar_artefatos(_df_filmes, diretorio, k, motor, raiz)
+    if artefatos is not None:
+        return artefatos
+
+    modelo, df_clusters, origem = treinar_com_origem(_tabela_proporcao, k=k, motor=motor)
+    indice = construir_indice_recomendacao.__wrapped__(df_clusters, _tabela_completa, _df_filmes)
+    salvar_artefatos(modelo, df_clusters, indice, diretorio, k, motor, raiz, origem=origem)
+    return modelo, df_clusters, indice
@@ -0,0 +1,286 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# BENCHMARK DO PIPELINE (SEM STREAMLIT)
+#
+#   python benchmark.py gerar --diretorio /tmp/bench --usuarios 6040 --filmes 3883 --avaliacoes 1000000
+#   python benchmark.py executar --diretorio /tmp/bench --saida resultado.json [--comparar anterior.json]
+#
+# `gerar` cria movies.dat e ratings.dat no formato do MovieLens (com cabeçalho).
+# `executar` roda cada etapa num processo novo, para que o pico de memória (RSS)
+# de uma etapa não contamine a outra, e grava tempos e memória em JSON.
+# Por padrão os caches do Streamlit são ignorados (chamando a função original
+# via __wrapped__); com --com-cache-streamlit as repetições passam pelo cache.
+
+GENEROS = ['Action', 'Adventure', 'Animation', "Children's", 'Comedy', 'Crime', 'Documentary', 'Drama',
+           'Fantasy', 'Film-Noir', 'Horror', 'Musical', 'Mystery', 'Romance', 'Sci-Fi', 'Thriller', 'War', 'Western']
+
+ETAPAS = ('carregar_dados_frio', 'carregar_dados', 'treinar_modelo', 'recomendar_filmes',
+          'obter_detalhes_cluster', 'varrer_k')
+
+LINHAS_POR_ESCRITA = 1_000_000
+
+
+# GERADOR DE DADOS SINTÉTICOS
+# assimetria_generos / assimetria_filmes: expoente de Zipf da frequência dos gêneros
+# no catálogo e da popularidade dos filmes (0 = uniforme)
+def gerar_dados(diretorio, usuarios=6040, filmes=3883, avaliacoes=1_000_000,
+                assimetria_generos=1.0, assimetria_filmes=1.0, semente=42):
+    rng = np.random.default_rng(semente)
+    os.makedirs(diretorio, exist_ok=True)
+
+    pesos_generos = 1.0 / np.arange(1, len(GENEROS) + 1) ** assimetria_generos
+    pesos_generos = pesos_generos[rng.permutation(len(GENEROS))]
+    pesos_generos /= pesos_generos.sum()
+
+    with open(os.path.join(diretorio, 'movies.dat'), 'w', encoding='latin-1') as f:
+        f.write('movieId::title::genres\n')
+        for filme in range(1, filmes + 1):
+            quantidade = rng.choice([1, 2, 3], p=[0.5, 0.35, 0.15])
+            escolhidos = np.sort(rng.choice(len(GENEROS), size=quantidade, replace=False, p=pesos_generos))
+            generos = '|'.join(GENEROS[g] for g in escolhidos)
+            f.write(f'{filme}::Filme {filme} ({rng.integers(1919, 2001)})::{generos}\n')
+
+    # Popularidade de Zipf (em ordem aleatória de movieId) e atividade log-normal dos usuários
+    popularidade = 1.0 / np.arange(1, filmes + 1) ** assimetria_filmes
+    popularidade = popularidade[rng.permutation(filmes)]
+    popularidade /= popularidade.sum()
+    atividade = rng.lognormal(0.0, 1.0, usuarios)
+    atividade /= atividade.sum()
+
+    qualidade = rng.normal(3.5, 0.5, filmes)
+    vies = rng.normal(0.0, 0.3, usuarios)
+
+    with open(os.path.join(diretorio, 'ratings.dat'), 'w') as f:
+        f.write('userId::movieId::rating::timestamp\n')
+        for inicio in range(0, avaliacoes, LINHAS_POR_ESCRITA):
+            n = min(LINHAS_POR_ESCRITA, avaliacoes - inicio)
+            u = rng.choice(usuarios, size=n, p=atividade)
+            m = rng.choice(filmes, size=n, p=popularidade)
+            notas = np.clip(np.rint(qualidade[m] + vies[u] + rng.normal(0.0, 1.0, n)), 1, 5)
+            horarios = rng.integers(956703932, 1046454590, n)
+            np.savetxt(f, np.column_stack([u + 1, m + 1, notas, horarios]).astype(np.int64), fmt='%d::%d::%d::%d')
+
+    return diretorio
+
+
+# MEDIÇÃO DE UMA ETAPA (roda dentro do processo filho)
+
+# Pico de RSS do processo em MB (ru_maxrss vem em KB no Linux e em bytes no macOS)
+def _pico_rss_mb():
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+
+
+def _sem_cache(funcao, com_cache):
+    return funcao if com_cache else getattr(funcao, '__wrapped__', funcao)
+
+
+# Prepara o que a etapa precisa e devolve (função medida, linhas processadas)
+def _preparar_etapa(etapa, diretorio, k, motor, k_max, amostra_usuarios, com_cache):
+    from data_processing import carregar_dados
+    from leitura_dados import PASTA_CACHE
+    import ml_models
+    import recommender
+
+    carregar = _sem_cache(carregar_dados, com_cache)
+
+    if etapa == 'carregar_dados_frio':
+        def executar():
+            shutil.rmtree(os.path.join(diretorio, PASTA_CACHE), ignore_errors=True)
+            return carregar(diretorio)
+        return executar, None
+    if etapa == 'carregar_dados':
+        carregar(diretorio)  # garante o cache em disco pronto
+        return lambda: carregar(diretorio), None
+
+    movies, ratings, tabela_completa, tabela_proporcao = carregar(diretorio)
+    treinar = _sem_cache(ml_models.treinar_modelo, com_cache)
+
+    if etapa == 'treinar_modelo':
+        return lambda: treinar(tabela_proporcao, k, motor=motor), len(tabela_proporcao)
+    if etapa == 'varrer_k':
+        def executar():
+            if not com_cache:
+                ml_models._cache_varredura.clear()
+            return ml_models.varrer_k(tabela_proporcao, range(2, k_max + 1))
+        return executar, len(tabela_proporcao)
+
+    _, df_clusters = ml_models.treinar_modelo.__wrapped__(tabela_proporcao, k, motor=motor)
+
+    if etapa == 'recomendar_filmes':
+        rng = np.random.default_rng(42)
+        usuarios = rng.choice(df_clusters.index.to_numpy(), size=min(amostra_usuarios, len(df_clusters)), replace=False)
+
+        def executar():
+            for usuario in usuarios:
+                recommender.recomendar_filmes(usuario, df_clusters, tabela_completa, movies, top_n=10)
+        return executar, len(usuarios)
+    if etapa == 'obter_detalhes_cluster':
+        clusters = sorted(df_clusters['Cluster'].unique().tolist())
+
+        def executar():
+            for cluster in clusters:
+                recommender.obter_detalhes_cluster(cluster, df_clusters, ratings)
+        return executar, len(clusters)
+
+    raise ValueError(f'etapa desconhecida: {etapa}')
+
+
+def medir_etapa(etapa, diretorio, k=5, motor='kmeans', k_max=10, amostra_usuarios=20, repeticoes=3, com_cache=False):
+    import logging
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+
+    executar, linhas = _preparar_etapa(etapa, diretorio, k, motor, k_max, amostra_usuarios, com_cache)
+    pico_antes = _pico_rss_mb()
+
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        executar()
+        tempos.append(time.perf_counter() - inicio)
+
+    pico = _pico_rss_mb()
+    return {
+        'tempos_s': tempos,
+        'mediana_s': statistics.median(tempos),
+        'minimo_s': min(tempos),
+        'linhas': linhas,
+        'pico_rss_mb': pico,
+        'pico_rss_preparo_mb': pico_antes,
+        'pico_rss_etapa_mb': pico - pico_antes,
+    }
+
+
+# EXECUÇÃO COMPLETA (processo pai)
+
+def _versao_codigo():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _descrever_dados(diretorio):
+    dados = {'diretorio': os.path.abspath(diretorio)}
+    for nome in ('movies.dat', 'ratings.dat'):
+        caminho = os.path.join(diretorio, nome)
+        with open(caminho, 'rb') as f:
+            linhas = sum(bloco.count(b'\n') for bloco in iter(lambda: f.read(1 << 20), b''))
+        dados[nome] = {'bytes': os.path.getsize(caminho), 'linhas': linhas - 1}
+    return dados
+
+
+# Razão atual / anterior de tempo e memória (acima de 1 = ficou mais lento ou maior)
+def comparar(anterior, atual):
+    comparacao = {}
+    for etapa, medida in atual['etapas'].items():
+        base = anterior.get('etapas', {}).get(etapa)
+        if not base or 'erro' in base or 'erro' in medida:
+            continue
+        comparacao[etapa] = {
+            'tempo': medida['mediana_s'] / base['mediana_s'] if base['mediana_s'] else None,
+            'pico_rss': medida['pico_rss_mb'] / base['pico_rss_mb'] if base['pico_rss_mb'] else None,
+        }
+    return comparacao
+
+
+def executar_benchmark(diretorio, etapas=ETAPAS, k=5, motor='kmeans', k_max=10, amostra_usuarios=20,
+                       repeticoes=3, com_cache=False):
+    resultado = {
+        'versao_codigo': _versao_codigo(),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'dados': _descrever_dados(diretorio),
+        'parametros': {'k': k, 'motor': motor, 'k_max': k_max, 'amostra_usuarios': amostra_usuarios,
+                       'repeticoes': repeticoes, 'com_cache_streamlit': com_cache},
+        'etapas': {},
+    }
+    for etapa in etapas:
+        comando = [sys.executable, os.path.abspath(__file__), '_etapa', etapa, '--diretorio', os.path.abspath(diretorio),
+                   '--k', str(k), '--motor', motor, '--k-max', str(k_max),
+                   '--amostra-usuarios', str(amostra_usuarios), '--repeticoes', str(repeticoes)]
+        if com_cache:
+            comando.append('--com-cache-streamlit')
+        processo = subprocess.run(comando, capture_output=True, text=True)
+        if processo.returncode != 0:
+            resultado['etapas'][etapa] = {'erro': processo.stderr.strip().splitlines()[-1:] or ['sem saída']}
+            continue
+        resultado['etapas'][etapa] = json.loads(processo.stdout.strip().splitlines()[-1])
+    return resultado
+
+
+def _opcoes_medicao(parser):
+    parser.add_argument('--diretorio', default='DataBase', help='pasta com movies.dat e ratings.dat')
+    parser.add_argument('--k', type=int, default=5, help='quantidade de clusters do K-Means')
+    parser.add_argument('--motor', default='kmeans', help='motor de treinamento (kmeans, minibatch, incremental)')
+    parser.add_argument('--k-max', type=int, default=10, help='maior K da varredura (varrer_k)')
+    parser.add_argument('--amostra-usuarios', type=int, default=20, help='usuários em recomendar_filmes')
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--com-cache-streamlit', action='store_true',
+                        help='não ignora os caches do Streamlit (repetições passam pelo cache)')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark do pipeline de recomendação.')
+    comandos = parser.add_subparsers(dest='comando', required=True)
+
+    gerar = comandos.add_parser('gerar', help='gera movies.dat e ratings.dat sintéticos')
+    gerar.add_argument('--diretorio', required=True)
+    gerar.add_argument('--usuarios', type=int, default=6040)
+    gerar.add_argument('--filmes', type=int, default=3883)
+    gerar.add_argument('--avaliacoes', type=int, default=1_000_000)
+    gerar.add_argument('--assimetria-generos', type=float, default=1.0, help='expoente de Zipf dos gêneros')
+    gerar.add_argument('--assimetria-filmes', type=float, default=1.0, help='expoente de Zipf da popularidade')
+    gerar.add_argument('--semente', type=int, default=42)
+
+    executar = comandos.add_parser('executar', help='mede todas as etapas e grava o JSON')
+    _opcoes_medicao(executar)
+    executar.add_argument('--etapas', nargs='+', choices=ETAPAS, default=list(ETAPAS))
+    executar.add_argument('--saida', help='arquivo JSON (padrão: saída padrão)')
+    executar.add_argument('--comparar', help='JSON de uma execução anterior para comparação')
+
+    etapa = comandos.add_parser('_etapa')  # uso interno: uma etapa por processo
+    etapa.add_argument('etapa', choices=ETAPAS)
+    _opcoes_medicao(etapa)
+
+    args = parser.parse_args(argv)
+
+    if args.comando == 'gerar':
+        gerar_dados(args.diretorio, args.usuarios, args.filmes, args.avaliacoes,
+                    args.assimetria_generos, args.assimetria_filmes, args.semente)
+        print(f'Dados gerados em {os.path.abspath(args.diretorio)}')
+        return
+
+    if args.comando == '_etapa':
+        medida = medir_etapa(args.etapa, args.diretorio, args.k, args.motor, args.k_max,
+                             args.amostra_usuarios, args.repeticoes, args.com_cache_streamlit)
+        print(json.dumps(medida))
+        return
+
+    resultado = executar_benchmark(args.diretorio, args.etapas, args.k, args.motor, args.k_max,
+                                   args.amostra_usuarios, args.repeticoes, args.com_cache_streamlit)
+    if args.comparar:
+        with open(args.comparar, 'r', encoding='utf-8') as f:
+            resultado['comparacao'] = comparar(json.load(f), resultado)
+
+    texto = json.dumps(resultado, indent=2)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            f.write(texto)
+    print(texto)
+
+
+if __name__ == '__main__':
+    main()
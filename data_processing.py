@@ -1,39 +1,115 @@
+import os
+from dataclasses import dataclass
+
+import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 import streamlit as st
+from instrumentacao import instrumentar
+from leitura_dados import ler_filmes, ler_avaliacoes
+
+
+# MATRIZES ESPARSAS DO MODELO
+# Linhas = usuários (na ordem em que aparecem em ratings.dat), colunas = filmes ou gêneros
+@dataclass
+class MatrizesEsparsas:
+    usuarios: np.ndarray            # userId de cada linha
+    filmes: np.ndarray              # movieId de cada coluna de `avaliacoes` / linha de `incidencia`
+    generos: list                   # nome de cada coluna de `contagem_generos`
+    avaliacoes: sp.csr_matrix       # usuários x filmes (nota; última nota em caso de repetição)
+    incidencia: sp.csr_matrix       # filmes x gêneros (1 se o filme pertence ao gênero)
+    contagem_generos: sp.csr_matrix # usuários x gêneros (quantidade de avaliações >= 3.0)
+
+    # Mesma tabela de proporções que o app sempre usou (DataFrame denso usuários x gêneros)
+    def tabela_proporcao(self):
+        return montar_tabela_proporcao(self.contagem_generos, self.usuarios, self.generos)
+
+
+# Contagem usuários x gêneros -> proporção de cada gênero entre os filmes bons do usuário
+def montar_tabela_proporcao(contagem_generos, usuarios, generos):
+    contagem = contagem_generos.toarray().astype(np.float64)
+    total = contagem.sum(axis=1, keepdims=True)
+    proporcao = np.divide(contagem, total, out=np.zeros_like(contagem), where=total > 0)
+
+    return pd.DataFrame(
+        proporcao,
+        index=pd.Index(usuarios, name='userId'),
+        columns=pd.Index(generos, name='genres'),
+    )
+
+
+# Matriz filmes x gêneros a partir da coluna 'Gênero1|Gênero2|...'
+def construir_incidencia_generos(tabela_movie):
+    dummies = tabela_movie['genres'].astype(str).str.get_dummies(sep='|')
+    return sp.csr_matrix(dummies.to_numpy(dtype=np.float64)), dummies.columns.tolist()
+
+
+@instrumentar('construir_matrizes', linhas=lambda m: len(m.usuarios))
+def construir_matrizes(tabela_movie, tabela_ratings):
+    # Códigos inteiros: usuários na ordem de aparição, filmes na ordem de movies.dat
+    codigo_usuario, usuarios = pd.factorize(tabela_ratings['userId'])
+    filmes = tabela_movie['movieId'].to_numpy()
+    codigo_filme = pd.Index(filmes).get_indexer(tabela_ratings['movieId'])
+    notas = tabela_ratings['rating'].to_numpy()
+
+    # Avaliações de filmes fora do catálogo somem (igual ao merge interno)
+    conhecidos = codigo_filme >= 0
+    linhas, colunas, notas = codigo_usuario[conhecidos], codigo_filme[conhecidos], notas[conhecidos]
+    formato = (len(usuarios), len(filmes))
+
+    incidencia, generos = construir_incidencia_generos(tabela_movie)
+
+    # Quantos filmes bons (nota >= 3.0) de cada gênero o usuário viu
+    bons = notas >= 3.0
+    favoritos = sp.csr_matrix(
+        (np.ones(bons.sum()), (linhas[bons], colunas[bons])), shape=formato
+    )
+    contagem_generos = (favoritos @ incidencia).tocsr()
+
+    # Só entram como coluna os gêneros que aparecem em alguma avaliação boa
+    presentes = np.flatnonzero(contagem_generos.getnnz(axis=0))
+    contagem_generos = contagem_generos[:, presentes]
+    generos = [generos[i] for i in presentes]
+
+    # Matriz de notas sem somar avaliações repetidas (fica a última)
+    repetidas = pd.Series(linhas.astype(np.int64) * formato[1] + colunas).duplicated(keep='last').to_numpy()
+    avaliacoes = sp.csr_matrix(
+        (notas[~repetidas].astype(np.float32), (linhas[~repetidas], colunas[~repetidas])), shape=formato
+    )
+
+    return MatrizesEsparsas(
+        usuarios=np.asarray(usuarios), filmes=filmes, generos=generos,
+        avaliacoes=avaliacoes, incidencia=incidencia, contagem_generos=contagem_generos,
+    )
+
+
+@instrumentar('carregar_matrizes', cache=st.cache_resource, linhas=lambda m: len(m.usuarios))
+def carregar_matrizes(diretorio='DataBase'):
+    tabela_movie = ler_filmes(os.path.join(diretorio, 'movies.dat'))
+    tabela_ratings = ler_avaliacoes(os.path.join(diretorio, 'ratings.dat'))
+    return construir_matrizes(tabela_movie, tabela_ratings)
+
+
+# Junta título e gêneros da dimensão de filmes em poucas linhas (top-N, amostras para exibição)
+def anexar_filmes(tabela, tabela_movie, colunas=('title', 'genres')):
+    return tabela.merge(tabela_movie[['movieId', *colunas]], on='movieId', how='left')
+
 
 # CARREGAMENTO E PREPARAÇÃO DOS DADOS
-@st.cache_data
-def carregar_dados():
-    
-    
-    tabela_movie = pd.read_csv('DataBase/movies.dat', sep='::', engine='python', names=['movieId', 'title', 'genres'], encoding='latin-1', header=0)
-    tabela_ratings = pd.read_csv('DataBase/ratings.dat', sep='::', engine='python', names=['userId', 'movieId', 'rating', 'timestamp'], header=0)
-    
-    # Joga a coluna timestamp fora para economizar memória
-    tabela_ratings = tabela_ratings.drop(columns=['timestamp'])
-    
-    # Mergiando as tabelas lidas com base no movieId
-    tabela_merge = tabela_ratings.merge(tabela_movie, on='movieId')
-    
-    # Ideia de filtro para usar os filmes que as pessoas gostam
-    tabela_bons_filmes = tabela_merge[tabela_merge['rating'] >= 3.0].copy()
-    
-    # Separando os generos
-    tabela_bons_filmes['genres'] = tabela_bons_filmes['genres'].str.split('|')
-    
-    # Fazendo a nova lista de generos virar linhas -> explode
-    tabela_bons_filmes = tabela_bons_filmes.explode('genres')
-    
-    # Contando quantos filmes bons de cada gênero o usuário viu
-    tabela_contagem_favoritos = tabela_bons_filmes.groupby(['userId', 'genres'])['rating'].count().unstack().fillna(0)
-    
-    # Transformando a contagem em PROPORÇÃO
-    total_filmes_usuario = tabela_contagem_favoritos.sum(axis=1)
-    tabela_proporcao = tabela_contagem_favoritos.div(total_filmes_usuario, axis=0).fillna(0)
-    
-    # Pegar todos os IDs únicos 
-    todos_os_usuarios = tabela_ratings['userId'].unique()
-    # Força a tabela a ter todos esses IDs, quem sumiu na filtragem ganha uma linha cheia de 0
-    tabela_proporcao = tabela_proporcao.reindex(todos_os_usuarios, fill_value=0.0)
-    
-    return tabela_movie, tabela_ratings, tabela_merge, tabela_proporcao
\ No newline at end of file
+@instrumentar('carregar_dados', cache=st.cache_data, linhas=lambda r: len(r[1]))
+def carregar_dados(diretorio='DataBase'):
+
+    # Leitura com parser em C + cache colunar (a coluna timestamp já é descartada na leitura)
+    tabela_movie = ler_filmes(os.path.join(diretorio, 'movies.dat'))
+    tabela_ratings = ler_avaliacoes(os.path.join(diretorio, 'ratings.dat'))
+
+    # Tabela "mesclada" enxuta: só as avaliações de filmes do catálogo (como no merge interno),
+    # com userId/movieId int32 e nota compacta. Título e gêneros ficam uma vez só em
+    # tabela_movie e são juntados apenas nas linhas finais (ver anexar_filmes)
+    tabela_merge = tabela_ratings[tabela_ratings['movieId'].isin(tabela_movie['movieId'])].reset_index(drop=True)
+
+    # Proporção de filmes bons por gênero calculada direto nas matrizes esparsas
+    # (sem explode/unstack); usuários sem nenhuma nota boa ficam com linha de 0
+    tabela_proporcao = construir_matrizes(tabela_movie, tabela_ratings).tabela_proporcao()
+
+    return tabela_movie, tabela_ratings, tabela_merge, tabela_proporcao
@@ -0,0 +1,213 @@
+import argparse
+import json
+import math
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from leitura_dados import ler_avaliacoes_em_blocos
+from recommender import construir_indice_recomendacao, recomendar_filmes_indexado
+
+# RECOMENDAÇÃO APROXIMADA COM ESBOÇOS (SKETCHES) POR CLUSTER
+#
+# Em vez de agregar exatamente (cluster, filme), cada cluster guarda:
+#  - um Count-Min Sketch com a contagem de avaliações por filme;
+#  - um Count-Min Sketch com a soma das notas em ponto fixo (nota x ESCALA_NOTA);
+#  - um resumo Misra-Gries dos filmes mais avaliados (candidatos ao top-N).
+# Tudo é construído em streaming a partir de ratings.dat e os esboços são
+# "mescláveis": blocos processados separadamente podem ser somados depois.
+#
+# Botão de precisão: `precisao` (epsilon). Com probabilidade `confianca`, a contagem
+# estimada de um filme passa da real em no máximo epsilon x (avaliações do cluster).
+# Avaliações repetidas (mesmo usuário, filme e nota) contam mais de uma vez aqui.
+
+ESCALA_NOTA = 100
+_PRIMO = (1 << 31) - 1
+
+
+class EsbocosClusters:
+
+    def __init__(self, k, precisao=0.001, confianca=0.99, capacidade=None, semente=42):
+        self.k = k
+        self.largura = int(math.ceil(math.e / precisao))
+        self.profundidade = int(math.ceil(math.log(1.0 / (1.0 - confianca))))
+        self.capacidade = capacidade or int(math.ceil(1.0 / precisao))
+
+        rng = np.random.default_rng(semente)
+        self._a = rng.integers(1, _PRIMO, self.profundidade, dtype=np.int64)
+        self._b = rng.integers(0, _PRIMO, self.profundidade, dtype=np.int64)
+
+        self.contagem = np.zeros((k, self.profundidade, self.largura), dtype=np.int64)
+        self.somas = np.zeros((k, self.profundidade, self.largura), dtype=np.int64)
+        self.candidatos = [pd.Series(dtype=np.int64) for _ in range(k)]
+
+    # Coluna de cada filme em cada linha do sketch: shape (profundidade, n)
+    def _colunas(self, filmes):
+        filmes = np.asarray(filmes, dtype=np.int64)
+        return ((self._a[:, None] * filmes[None, :] + self._b[:, None]) % _PRIMO) % self.largura
+
+    # Misra-Gries: junta os contadores e, se passar da capacidade, desconta o (m+1)-ésimo
+    def _mesclar_candidatos(self, cluster, novos):
+        juntos = self.candidatos[cluster].add(novos, fill_value=0).astype(np.int64)
+        if len(juntos) > self.capacidade:
+            limite = juntos.nlargest(self.capacidade + 1).iloc[-1]
+            juntos = juntos[juntos > limite] - limite
+        self.candidatos[cluster] = juntos
+
+    def atualizar(self, clusters, filmes, notas):
+        if len(filmes) == 0:
+            return
+        # Posição achatada (cluster, linha, coluna) de cada atualização -> bincount
+        colunas = self._colunas(filmes)
+        linhas = np.arange(self.profundidade)[:, None]
+        posicoes = ((clusters[None, :] * self.profundidade + linhas) * self.largura + colunas).ravel()
+        pontos = np.rint(np.asarray(notas, dtype=np.float64) * ESCALA_NOTA)
+        pesos = np.broadcast_to(pontos[None, :], colunas.shape).ravel()
+
+        tamanho = self.contagem.size
+        self.contagem += np.bincount(posicoes, minlength=tamanho).reshape(self.contagem.shape)
+        self.somas += np.rint(np.bincount(posicoes, weights=pesos, minlength=tamanho)).astype(np.int64).reshape(self.somas.shape)
+
+        # Contagem exata dentro do bloco, depois mesclada no resumo de cada cluster
+        chaves, contagens = np.unique(clusters.astype(np.int64) << 32 | np.asarray(filmes, dtype=np.int64), return_counts=True)
+        clusters_chave = chaves >> 32
+        for cluster in np.unique(clusters_chave):
+            do_cluster = clusters_chave == cluster
+            self._mesclar_candidatos(int(cluster), pd.Series(contagens[do_cluster], index=chaves[do_cluster] & 0xFFFFFFFF))
+
+    def mesclar(self, outro):
+        self.contagem += outro.contagem
+        self.somas += outro.somas
+        for cluster in range(self.k):
+            self._mesclar_candidatos(cluster, outro.candidatos[cluster])
+        return self
+
+    # Contagem (mínimo entre as linhas) e média (da mesma célula da contagem mínima)
+    def estimar(self, cluster, filmes):
+        colunas = self._colunas(filmes)
+        linhas = np.arange(self.profundidade)[:, None]
+        contagens = self.contagem[cluster][linhas, colunas]
+        melhor = np.argmin(contagens, axis=0)
+        contagem = contagens[melhor, np.arange(len(filmes))]
+        somas = self.somas[cluster][linhas, colunas][melhor, np.arange(len(filmes))]
+        media = np.divide(somas, contagem * ESCALA_NOTA, out=np.zeros(len(filmes)), where=contagem > 0)
+        return contagem, media
+
+    # Ranking aproximado do cluster, no mesmo formato do índice exato
+    def ranking(self, cluster, min_avaliacoes=3):
+        filmes = self.candidatos[cluster].index.to_numpy(dtype=np.int64)
+        contagem, media = self.estimar(cluster, filmes)
+        ranking = pd.DataFrame({'movieId': filmes, 'nota_media_cluster': media, 'contagem_avaliacoes': contagem})
+        ranking = ranking[(ranking['contagem_avaliacoes'] >= min_avaliacoes) & (ranking['nota_media_cluster'] >= 3.0)]
+        return ranking.sort_values(
+            by=['contagem_avaliacoes', 'nota_media_cluster', 'movieId'], ascending=[False, False, True]
+        ).reset_index(drop=True)
+
+
+# Constrói os esboços a partir de blocos de avaliações (só filmes do catálogo, como no merge).
+# `blocos` é qualquer iterável de DataFrames com userId, movieId e rating; por padrão
+# use ler_avaliacoes_em_blocos para ler ratings.dat em streaming.
+def construir_esbocos(blocos, df_clusters, df_filmes, precisao=0.001, confianca=0.99, capacidade=None):
+    k = int(df_clusters['Cluster'].max()) + 1
+    esbocos = EsbocosClusters(k, precisao, confianca, capacidade)
+    cluster_do_usuario = df_clusters['Cluster']
+    catalogo = pd.Index(df_filmes['movieId'])
+
+    for bloco in blocos:
+        clusters = bloco['userId'].map(cluster_do_usuario).to_numpy()
+        validos = ~np.isnan(clusters) & (catalogo.get_indexer(bloco['movieId']) >= 0)
+        esbocos.atualizar(clusters[validos].astype(np.int64), bloco['movieId'].to_numpy()[validos],
+                          bloco['rating'].to_numpy()[validos])
+    return esbocos
+
+
+# Índice de recomendação com rankings aproximados (servido por recomendar_filmes_indexado).
+# `vistos` precisa ter .get(usuario) -> filmes já vistos (ex.: o do índice exato ou VistosCSR).
+def construir_indice_aproximado(esbocos, df_clusters, df_filmes, vistos, min_avaliacoes=3):
+    titulos = df_filmes[['movieId', 'title']]
+    ranking = {}
+    for cluster in range(esbocos.k):
+        ranking_cluster = esbocos.ranking(cluster, min_avaliacoes)
+        ranking_cluster['movieId'] = ranking_cluster['movieId'].astype(df_filmes['movieId'].dtype)
+        ranking[cluster] = ranking_cluster.merge(titulos, on='movieId', how='left')[
+            ['movieId', 'title', 'nota_media_cluster', 'contagem_avaliacoes']]
+
+    return {
+        'cluster_do_usuario': df_clusters['Cluster'],
+        'ranking': ranking,
+        'vistos': vistos,
+        'filmes': df_filmes,
+    }
+
+
+# Divide uma tabela já carregada em blocos (mesma interface da leitura em streaming)
+def blocos_da_tabela(tabela, linhas_por_bloco=1_000_000):
+    for inicio in range(0, len(tabela), linhas_por_bloco):
+        yield tabela.iloc[inicio:inicio + linhas_por_bloco]
+
+
+# Compara com o caminho exato: recall@N médio e aceleração na construção (ambos a partir
+# da tabela em memória). Com `caminho_ratings`, mede também a construção em streaming do arquivo.
+def comparar_com_exato(df_clusters, tabela_completa, df_filmes, top_n=10, precisao=0.001,
+                       amostra_usuarios=500, semente=42, caminho_ratings=None):
+    inicio = time.perf_counter()
+    indice_exato = construir_indice_recomendacao.__wrapped__(df_clusters, tabela_completa, df_filmes)
+    tempo_exato = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    esbocos = construir_esbocos(blocos_da_tabela(tabela_completa), df_clusters, df_filmes, precisao=precisao)
+    indice_aproximado = construir_indice_aproximado(esbocos, df_clusters, df_filmes, indice_exato['vistos'])
+    tempo_aproximado = time.perf_counter() - inicio
+
+    rng = np.random.default_rng(semente)
+    usuarios = df_clusters.index.to_numpy()
+    usuarios = rng.choice(usuarios, size=min(amostra_usuarios, len(usuarios)), replace=False)
+
+    recalls = []
+    for usuario in usuarios:
+        exato = set(recomendar_filmes_indexado(usuario, indice_exato, top_n)['Título'])
+        if not exato:
+            continue
+        aproximado = set(recomendar_filmes_indexado(usuario, indice_aproximado, top_n)['Título'])
+        recalls.append(len(exato & aproximado) / len(exato))
+
+    resultado = {
+        'top_n': top_n,
+        'precisao': precisao,
+        'largura': esbocos.largura,
+        'profundidade': esbocos.profundidade,
+        'capacidade': esbocos.capacidade,
+        f'recall@{top_n}': float(np.mean(recalls)) if recalls else None,
+        'tempo_exato_s': tempo_exato,
+        'tempo_aproximado_s': tempo_aproximado,
+        'aceleracao': tempo_exato / tempo_aproximado if tempo_aproximado > 0 else None,
+    }
+    if caminho_ratings is not None:
+        inicio = time.perf_counter()
+        construir_esbocos(ler_avaliacoes_em_blocos(caminho_ratings), df_clusters, df_filmes, precisao=precisao)
+        resultado['tempo_streaming_arquivo_s'] = time.perf_counter() - inicio
+    return resultado
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compara a recomendação aproximada (esboços) com a exata.')
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--top-n', type=int, default=10)
+    parser.add_argument('--precisao', type=float, default=0.001, help='epsilon do Count-Min Sketch')
+    parser.add_argument('--diretorio', default='DataBase')
+    args = parser.parse_args(argv)
+
+    from data_processing import carregar_dados
+    from ml_models import treinar_modelo
+
+    movies, _, tabela_completa, tabela_proporcao = carregar_dados(args.diretorio)
+    _, df_clusters = treinar_modelo(tabela_proporcao, k=args.k)
+    resultado = comparar_com_exato(df_clusters, tabela_completa, movies, top_n=args.top_n, precisao=args.precisao,
+                                   caminho_ratings=os.path.join(args.diretorio, 'ratings.dat'))
+    print(json.dumps(resultado, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import streamlit as st
+
+from data_processing import construir_incidencia_generos
+
+# ÍNDICE DE AVALIAÇÕES POR USUÁRIO (FORMATO CSR)
+#
+# As avaliações ficam ordenadas por userId (mantendo a ordem original dentro de
+# cada usuário) e um vetor de offsets marca onde começa cada usuário. Assim as
+# avaliações de um usuário saem como uma fatia contínua, sem varrer a tabela.
+# Quantidade, média e histograma de gêneros de cada usuário já ficam calculados.
+
+
+class IndiceAvaliacoes:
+
+    def __init__(self, df_ratings, df_movies):
+        ordem = np.argsort(df_ratings['userId'].to_numpy(), kind='stable')
+        self.avaliacoes = df_ratings.iloc[ordem].reset_index(drop=True)
+
+        ids = self.avaliacoes['userId'].to_numpy()
+        self.usuarios, inicio = np.unique(ids, return_index=True)
+        self.inicio = np.append(inicio, len(ids))
+        self.contagem = np.diff(self.inicio)
+
+        notas = self.avaliacoes['rating'].to_numpy(dtype=np.float64)
+        somas = np.add.reduceat(notas, self.inicio[:-1]) if len(self.usuarios) else np.zeros(0)
+        self.media = somas / np.maximum(self.contagem, 1)
+
+        # Histograma de gêneros (todas as avaliações, como em gerar_relatorio)
+        self.filmes = df_movies
+        incidencia, self.generos = construir_incidencia_generos(df_movies)
+        linha_filme = pd.Index(df_movies['movieId']).get_indexer(self.avaliacoes['movieId'])
+        linha_usuario = np.repeat(np.arange(len(self.usuarios)), self.contagem)
+        conhecidos = linha_filme >= 0
+        vistos = sp.csr_matrix(
+            (np.ones(conhecidos.sum()), (linha_usuario[conhecidos], linha_filme[conhecidos])),
+            shape=(len(self.usuarios), len(df_movies))
+        )
+        self.histograma = (vistos @ incidencia).tocsr()
+
+    def _linha(self, usuario):
+        linha = np.searchsorted(self.usuarios, usuario)
+        if linha < len(self.usuarios) and self.usuarios[linha] == usuario:
+            return linha
+        return None
+
+    # Todas as avaliações do usuário (fatia contínua; vazia se ele não existir)
+    def avaliacoes_do_usuario(self, usuario):
+        linha = self._linha(usuario)
+        if linha is None:
+            return self.avaliacoes.iloc[0:0]
+        return self.avaliacoes.iloc[self.inicio[linha]:self.inicio[linha + 1]]
+
+    # Avaliações do usuário com título e gêneros (só filmes do catálogo)
+    def avaliacoes_completas(self, usuario):
+        return self.avaliacoes_do_usuario(usuario).merge(self.filmes, on='movieId')
+
+    # (quantidade, média, contagem por gênero em ordem decrescente)
+    def resumo(self, usuario):
+        linha = self._linha(usuario)
+        if linha is None:
+            return 0, 0, pd.Series([], index=pd.Index([], name='genres'), name='count', dtype=np.int64)
+
+        histograma = self.histograma[linha]
+        generos = pd.Series(
+            histograma.data.astype(np.int64),
+            index=pd.Index([self.generos[i] for i in histograma.indices], name='genres'),
+            name='count',
+        )
+        return int(self.contagem[linha]), float(self.media[linha]), generos.sort_values(ascending=False, kind='stable')
+
+
+@st.cache_resource
+def construir_indice_avaliacoes(_df_ratings, _df_movies):
+    return IndiceAvaliacoes(_df_ratings, _df_movies)
@@ -0,0 +1,162 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import streamlit as st
+
+from data_processing import construir_incidencia_generos, montar_tabela_proporcao
+from instrumentacao import instrumentar
+from leitura_dados import TAMANHO_BLOCO, ler_avaliacoes_em_blocos, ler_filmes
+
+# INGESTÃO EM BLOCOS (ARQUIVOS DE AVALIAÇÕES MAIORES QUE A MEMÓRIA)
+#
+# Lê ratings.dat em blocos de tamanho limitado e vai somando só o que o modelo
+# precisa: quantos filmes bons (nota >= 3.0) de cada gênero cada usuário viu e,
+# por filme, quantidade de avaliações, soma das notas e avaliações boas. Nem a
+# tabela de avaliações inteira nem o merge com títulos/gêneros chegam a existir.
+# Com `processos` > 1 o arquivo é dividido em faixas de bytes, uma por tarefa, e
+# as somas parciais são juntadas na ordem das faixas, então o resultado é o
+# mesmo de carregar_dados (usuários na ordem em que aparecem no arquivo).
+
+FAIXAS_POR_PROCESSO = 4
+
+
+@dataclass
+class AgregadosAvaliacoes:
+    usuarios: np.ndarray             # userId de cada linha (ordem de aparição em ratings.dat)
+    generos: list                    # nome de cada coluna de `contagem_generos`
+    contagem_generos: sp.csr_matrix  # usuários x gêneros (quantidade de avaliações >= 3.0)
+    filmes: pd.DataFrame             # por movieId: contagem_avaliacoes, soma_notas, avaliacoes_boas
+
+    def tabela_proporcao(self):
+        return montar_tabela_proporcao(self.contagem_generos, self.usuarios, self.generos)
+
+
+# Soma contagens de pares (usuário, gênero) codificados numa única chave int64
+def _somar_pares(chaves, contagens):
+    chaves, inverso = np.unique(chaves, return_inverse=True)
+    return chaves, np.bincount(inverso, weights=contagens, minlength=len(chaves)).astype(np.int64)
+
+
+# Agrega uma faixa de bytes do arquivo (roda dentro de um processo do pool)
+def _agregar_faixa(caminho, inicio, fim, filmes, incidencia, tamanho_bloco):
+    catalogo = pd.Index(filmes)
+    n_generos = incidencia.shape[1]
+
+    ordem = []
+    chaves = np.zeros(0, dtype=np.int64)
+    contagens = np.zeros(0, dtype=np.int64)
+    contagem_filme = np.zeros(len(filmes), dtype=np.int64)
+    soma_filme = np.zeros(len(filmes), dtype=np.float64)
+    boas_filme = np.zeros(len(filmes), dtype=np.int64)
+
+    for bloco in ler_avaliacoes_em_blocos(caminho, tamanho_bloco, inicio, fim):
+        usuarios = bloco['userId'].to_numpy()
+        notas = bloco['rating'].to_numpy()
+        codigos = catalogo.get_indexer(bloco['movieId'])
+        ordem.append(pd.unique(usuarios))
+
+        # Avaliações de filmes fora do catálogo não contam (igual ao merge interno)
+        conhecidos = codigos >= 0
+        contagem_filme += np.bincount(codigos[conhecidos], minlength=len(filmes))
+        soma_filme += np.bincount(codigos[conhecidos], weights=notas[conhecidos], minlength=len(filmes))
+
+        bons = conhecidos & (notas >= 3.0)
+        boas_filme += np.bincount(codigos[bons], minlength=len(filmes))
+
+        # Cada avaliação boa vira um par (usuário, gênero) para cada gênero do filme
+        pares = incidencia[codigos[bons]].tocoo()
+        novas = usuarios[bons][pares.row].astype(np.int64) * n_generos + pares.col
+        chaves, contagens = _somar_pares(
+            np.concatenate([chaves, novas]), np.concatenate([contagens, np.ones(len(novas), dtype=np.int64)])
+        )
+
+    ordem = pd.unique(np.concatenate(ordem)) if ordem else np.zeros(0, dtype=np.int32)
+    return ordem, chaves, contagens, contagem_filme, soma_filme, boas_filme
+
+
+# Divide o arquivo em `partes` faixas de bytes (cada linha fica na faixa em que começa)
+def _faixas(caminho, partes):
+    tamanho = os.path.getsize(caminho)
+    limites = np.linspace(0, tamanho, partes + 1).astype(np.int64)
+    return [(int(a), int(b)) for a, b in zip(limites[:-1], limites[1:]) if b > a]
+
+
+@instrumentar('agregar_avaliacoes', linhas=lambda a: len(a.usuarios))
+def agregar_avaliacoes(caminho, tabela_movie, processos=1, tamanho_bloco=TAMANHO_BLOCO):
+    filmes = tabela_movie['movieId'].to_numpy()
+    incidencia, generos = construir_incidencia_generos(tabela_movie)
+    incidencia = incidencia.tocsr()
+
+    faixas = _faixas(caminho, processos * FAIXAS_POR_PROCESSO if processos > 1 else 1)
+    argumentos = [(caminho, inicio, fim, filmes, incidencia, tamanho_bloco) for inicio, fim in faixas]
+    if processos > 1:
+        with ProcessPoolExecutor(max_workers=processos) as executor:
+            parciais = list(executor.map(_agregar_faixa, *zip(*argumentos)))
+    else:
+        parciais = [_agregar_faixa(*a) for a in argumentos]
+
+    # Ordem global de aparição = ordem das faixas, e dentro de cada faixa a ordem local
+    usuarios = pd.unique(np.concatenate([p[0] for p in parciais]))
+    chaves, contagens = _somar_pares(np.concatenate([p[1] for p in parciais]),
+                                     np.concatenate([p[2] for p in parciais]))
+
+    n_generos = len(generos)
+    contagem_generos = sp.csr_matrix(
+        (contagens, (pd.Index(usuarios).get_indexer(chaves // n_generos), chaves % n_generos)),
+        shape=(len(usuarios), n_generos),
+    )
+
+    # Só entram como coluna os gêneros que aparecem em alguma avaliação boa
+    presentes = np.flatnonzero(contagem_generos.getnnz(axis=0))
+    contagem_generos = contagem_generos[:, presentes]
+
+    por_filme = pd.DataFrame({
+        'movieId': filmes,
+        'contagem_avaliacoes': sum(p[3] for p in parciais),
+        'soma_notas': sum(p[4] for p in parciais),
+        'avaliacoes_boas': sum(p[5] for p in parciais),
+    })
+    return AgregadosAvaliacoes(
+        usuarios=np.asarray(usuarios, dtype=np.int32), generos=[generos[i] for i in presentes],
+        contagem_generos=contagem_generos, filmes=por_filme,
+    )
+
+
+# Modo em blocos do carregamento: devolve (tabela_movie, tabela_proporcao, agregados)
+@st.cache_resource
+def carregar_dados_em_blocos(diretorio='DataBase', processos=1, tamanho_bloco=TAMANHO_BLOCO):
+    tabela_movie = ler_filmes(os.path.join(diretorio, 'movies.dat'))
+    agregados = agregar_avaliacoes(os.path.join(diretorio, 'ratings.dat'), tabela_movie, processos, tamanho_bloco)
+    return tabela_movie, agregados.tabela_proporcao(), agregados
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Calcula a tabela de proporções lendo ratings.dat em blocos.')
+    parser.add_argument('--diretorio', default='DataBase', help='pasta com movies.dat e ratings.dat')
+    parser.add_argument('--processos', type=int, default=1, help='processos em paralelo (faixas do arquivo)')
+    parser.add_argument('--tamanho-bloco-mb', type=int, default=TAMANHO_BLOCO // (1024 * 1024))
+    parser.add_argument('--verificar', action='store_true',
+                        help='compara com carregar_dados (que carrega tudo em memória)')
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    _, tabela_proporcao, agregados = carregar_dados_em_blocos.__wrapped__(
+        args.diretorio, args.processos, args.tamanho_bloco_mb * 1024 * 1024)
+    print(f'{len(agregados.usuarios)} usuários x {len(agregados.generos)} gêneros '
+          f'em {time.perf_counter() - inicio:.2f}s')
+
+    if args.verificar:
+        from data_processing import carregar_dados
+        esperada = carregar_dados.__wrapped__(args.diretorio)[3]
+        pd.testing.assert_frame_equal(tabela_proporcao, esperada)
+        print('tabela_proporcao idêntica à de carregar_dados')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+
+# INSTRUMENTAÇÃO DO PIPELINE (OPCIONAL)
+#
+# Ligada com a variável de ambiente RECOMENDACAO_INSTRUMENTACAO=1. Desligada, o
+# decorador `instrumentar` devolve a função como ela já era (sem custo algum).
+# Ligada, cada etapa registra: chamadas, tempo, linhas do resultado, variação de
+# memória (RSS) e acertos/falhas do cache do Streamlit. Os números saem em texto
+# no formato do Prometheus (`exportar_prometheus`) ou em JSON (`exportar_json`);
+# com RECOMENDACAO_INSTRUMENTACAO_ARQUIVO=<caminho> o JSON é gravado na saída do processo.
+#
+# `perfilar()` liga um profiler por amostragem (só biblioteca padrão) durante um
+# trecho, por exemplo uma única requisição lenta.
+
+ATIVA = os.environ.get('RECOMENDACAO_INSTRUMENTACAO', '') not in ('', '0')
+ARQUIVO_SAIDA = os.environ.get('RECOMENDACAO_INSTRUMENTACAO_ARQUIVO')
+
+AMOSTRAS_POR_ETAPA = 1000
+INTERVALO_AMOSTRAGEM = 0.005
+PERFIS_GUARDADOS = 20
+
+_trava = threading.Lock()
+_local = threading.local()
+_etapas = defaultdict(lambda: {
+    'chamadas': 0, 'segundos_total': 0.0, 'segundos_max': 0.0, 'linhas_total': 0,
+    'memoria_delta_bytes_total': 0, 'memoria_delta_bytes_max': 0,
+    'cache_acertos': 0, 'cache_falhas': 0, 'erros': 0,
+    'duracoes': deque(maxlen=AMOSTRAS_POR_ETAPA),
+})
+_perfis = deque(maxlen=PERFIS_GUARDADOS)
+
+
+# RSS atual do processo (Linux: /proc; nos outros sistemas, o pico do getrusage)
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico if sys.platform == 'darwin' else pico * 1024
+
+
+# Linhas do resultado: tamanho do DataFrame/Series, ou do primeiro item de uma tupla
+def _contar_linhas(resultado):
+    if isinstance(resultado, tuple):
+        resultado = next((r for r in resultado if hasattr(r, 'shape')), None)
+    if hasattr(resultado, 'shape') and len(resultado.shape) > 0:
+        return int(resultado.shape[0])
+    return 0
+
+
+def registrar(etapa, segundos, linhas=0, memoria_delta=0, cache_acerto=None, erro=False):
+    with _trava:
+        dados = _etapas[etapa]
+        dados['chamadas'] += 1
+        dados['segundos_total'] += segundos
+        dados['segundos_max'] = max(dados['segundos_max'], segundos)
+        dados['linhas_total'] += linhas
+        dados['memoria_delta_bytes_total'] += memoria_delta
+        dados['memoria_delta_bytes_max'] = max(dados['memoria_delta_bytes_max'], memoria_delta)
+        dados['duracoes'].append(segundos)
+        if erro:
+            dados['erros'] += 1
+        if cache_acerto is True:
+            dados['cache_acertos'] += 1
+        elif cache_acerto is False:
+            dados['cache_falhas'] += 1
+
+
+# Decorador de etapa. Com `cache` (st.cache_data / st.cache_resource) a função é
+# cacheada aqui dentro, e uma marcação na função original diz se a chamada executou
+# (falha no cache) ou não (acerto). `__wrapped__` continua apontando para a função
+# original, então quem ignora o cache com ele segue funcionando.
+def instrumentar(etapa, cache=None, linhas=_contar_linhas):
+    def decorador(funcao):
+        if not ATIVA:
+            return cache(funcao) if cache is not None else funcao
+
+        chamada = funcao
+        if cache is not None:
+            @functools.wraps(funcao)
+            def executada(*args, **kwargs):
+                pilha = getattr(_local, 'execucoes', None)
+                if pilha:
+                    pilha[-1] = True
+                return funcao(*args, **kwargs)
+            chamada = cache(executada)
+
+        @functools.wraps(funcao)
+        def medida(*args, **kwargs):
+            pilha = _local.__dict__.setdefault('execucoes', [])
+            pilha.append(False)
+            rss_inicio = _rss_bytes()
+            inicio = time.perf_counter()
+            resultado, erro = None, False
+            try:
+                resultado = chamada(*args, **kwargs)
+                return resultado
+            except Exception:
+                erro = True
+                raise
+            finally:
+                segundos = time.perf_counter() - inicio
+                executou = pilha.pop()
+                registrar(etapa, segundos, 0 if erro else linhas(resultado), _rss_bytes() - rss_inicio,
+                          cache_acerto=(not executou) if cache is not None else None, erro=erro)
+
+        medida.__wrapped__ = funcao
+        if cache is not None:
+            medida.clear = chamada.clear
+        return medida
+    return decorador
+
+
+def _quantil(valores, q):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(q * len(ordenados)))] if ordenados else 0.0
+
+
+def exportar_json():
+    with _trava:
+        return {
+            nome: {**{c: v for c, v in dados.items() if c != 'duracoes'},
+                   'p50_s': _quantil(dados['duracoes'], 0.5),
+                   'p99_s': _quantil(dados['duracoes'], 0.99)}
+            for nome, dados in sorted(_etapas.items())
+        }
+
+
+def gravar_json(caminho):
+    with open(caminho, 'w', encoding='utf-8') as f:
+        json.dump({'etapas': exportar_json(), 'perfis': listar_perfis()}, f, indent=2)
+
+
+# Texto no formato de exposição do Prometheus (version=0.0.4)
+def exportar_prometheus(prefixo='recomendacao'):
+    dados = exportar_json()
+    metricas = [
+        ('etapa_chamadas_total', 'counter', 'Chamadas da etapa.', 'chamadas'),
+        ('etapa_erros_total', 'counter', 'Chamadas da etapa que terminaram em exceção.', 'erros'),
+        ('etapa_segundos_max', 'gauge', 'Maior duração observada da etapa.', 'segundos_max'),
+        ('etapa_linhas_total', 'counter', 'Linhas produzidas pela etapa.', 'linhas_total'),
+        ('etapa_memoria_delta_bytes_total', 'counter', 'Soma da variação de RSS durante a etapa.', 'memoria_delta_bytes_total'),
+        ('etapa_memoria_delta_bytes_max', 'gauge', 'Maior variação de RSS durante a etapa.', 'memoria_delta_bytes_max'),
+        ('cache_acertos_total', 'counter', 'Chamadas servidas pelo cache do Streamlit.', 'cache_acertos'),
+        ('cache_falhas_total', 'counter', 'Chamadas que executaram a função (fora do cache).', 'cache_falhas'),
+    ]
+    linhas = []
+    for nome, tipo, ajuda, campo in metricas:
+        linhas += [f'# HELP {prefixo}_{nome} {ajuda}', f'# TYPE {prefixo}_{nome} {tipo}']
+        linhas += [f'{prefixo}_{nome}{{etapa="{e}"}} {d[campo]}' for e, d in dados.items()]
+
+    nome = f'{prefixo}_etapa_segundos'
+    linhas += [f'# HELP {nome} Duração da etapa.', f'# TYPE {nome} summary']
+    for e, d in dados.items():
+        linhas += [f'{nome}{{etapa="{e}",quantile="0.5"}} {d["p50_s"]}',
+                   f'{nome}{{etapa="{e}",quantile="0.99"}} {d["p99_s"]}',
+                   f'{nome}_sum{{etapa="{e}"}} {d["segundos_total"]}',
+                   f'{nome}_count{{etapa="{e}"}} {d["chamadas"]}']
+    return '\n'.join(linhas) + '\n'
+
+
+def zerar():
+    with _trava:
+        _etapas.clear()
+        _perfis.clear()
+
+
+# PROFILER POR AMOSTRAGEM
+# Uma thread lê a pilha das outras threads (sys._current_frames) a cada `intervalo`
+# segundos e conta quantas vezes cada pilha apareceu. `threads` restringe a captura
+# a algumas threads (padrão: todas, menos a própria amostradora).
+class AmostradorPerfil:
+
+    def __init__(self, intervalo=INTERVALO_AMOSTRAGEM, threads=None):
+        self.intervalo = intervalo
+        self.threads = set(threads) if threads else None
+        self.pilhas = Counter()
+        self.amostras = 0
+        self.segundos = 0.0
+        self._parar = threading.Event()
+        self._thread = None
+
+    def _amostrar(self):
+        propria = threading.get_ident()
+        while not self._parar.wait(self.intervalo):
+            for ident, quadro in sys._current_frames().items():
+                if ident == propria or (self.threads is not None and ident not in self.threads):
+                    continue
+                pilha = []
+                while quadro is not None:
+                    codigo = quadro.f_code
+                    pilha.append(f'{os.path.basename(codigo.co_filename)}:{codigo.co_name}')
+                    quadro = quadro.f_back
+                self.pilhas[';'.join(reversed(pilha))] += 1
+            self.amostras += 1
+
+    def iniciar(self):
+        self._inicio = time.perf_counter()
+        self._thread = threading.Thread(target=self._amostrar, name='amostrador-perfil', daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        self._thread.join()
+        self.segundos = time.perf_counter() - self._inicio
+        return self
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *excecao):
+        self.parar()
+
+    # Formato "pilha;colapsada contagem" (entrada do flamegraph.pl / speedscope)
+    def colapsado(self):
+        return '\n'.join(f'{pilha} {n}' for pilha, n in self.pilhas.most_common())
+
+    # Funções com mais amostras: próprias (topo da pilha) e inclusivas (em qualquer nível)
+    def mais_frequentes(self, n=15):
+        proprias, inclusivas = Counter(), Counter()
+        for pilha, contagem in self.pilhas.items():
+            funcoes = pilha.split(';')
+            proprias[funcoes[-1]] += contagem
+            for funcao in set(funcoes):
+                inclusivas[funcao] += contagem
+        return {'proprias': proprias.most_common(n), 'inclusivas': inclusivas.most_common(n)}
+
+    def resumo(self, nome=None):
+        return {'nome': nome, 'segundos': self.segundos, 'amostras': self.amostras,
+                'intervalo_s': self.intervalo, **self.mais_frequentes(), 'colapsado': self.colapsado()}
+
+
+# Captura um perfil do trecho e guarda o resumo (últimos PERFIS_GUARDADOS)
+@contextmanager
+def perfilar(nome, intervalo=INTERVALO_AMOSTRAGEM, threads=None):
+    amostrador = AmostradorPerfil(intervalo, threads)
+    with amostrador:
+        yield amostrador
+    guardar_perfil(amostrador, nome)
+
+
+# Para capturas que não cabem num `with` (ex.: do início ao fim de uma requisição)
+def guardar_perfil(amostrador, nome):
+    resumo = amostrador.resumo(nome)
+    with _trava:
+        _perfis.append(resumo)
+    return resumo
+
+
+def listar_perfis():
+    with _trava:
+        return list(_perfis)
+
+
+if ATIVA and ARQUIVO_SAIDA:
+    import atexit
+    atexit.register(gravar_json, ARQUIVO_SAIDA)
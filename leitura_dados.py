@@ -0,0 +1,176 @@
+import csv
+import io
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from instrumentacao import instrumentar
+
+# LEITURA RÁPIDA DOS ARQUIVOS .dat COM CACHE COLUNAR EM DISCO
+#
+# O formato do MovieLens usa '::' como separador, o que obriga o pandas a usar
+# o parser em Python puro. Aqui trocamos o '::' por um TAB em memória e usamos
+# o parser em C. Na primeira leitura as colunas são gravadas em arquivos .npy
+# (tipos compactos) e nas próximas são abertas com memory-map.
+
+VERSAO_CACHE = 1
+PASTA_CACHE = '.cache'
+
+# Títulos em string do Arrow (um buffer contínuo em vez de um objeto Python por título)
+TIPO_TITULO = 'string[pyarrow]'
+
+
+# Lê um arquivo '::' com o parser em C do pandas
+def _ler_dat(caminho, colunas, encoding='utf-8', dtype=None):
+    with open(caminho, 'rb') as arquivo:
+        conteudo = arquivo.read().replace(b'::', b'\t')
+
+    return pd.read_csv(
+        io.BytesIO(conteudo), sep='\t', engine='c', names=colunas, header=0,
+        encoding=encoding, dtype=dtype, quoting=csv.QUOTE_NONE
+    )
+
+
+# Identifica a versão do arquivo de origem (tamanho + data de modificação)
+def _assinatura_arquivo(caminho):
+    info = os.stat(caminho)
+    return {'versao': VERSAO_CACHE, 'tamanho': info.st_size, 'mtime_ns': info.st_mtime_ns}
+
+
+def _pasta_cache(caminho):
+    diretorio, nome = os.path.split(caminho)
+    return os.path.join(diretorio, PASTA_CACHE, os.path.splitext(nome)[0])
+
+
+# Devolve os metadados do cache se ele ainda corresponder ao arquivo de origem
+def _ler_meta_valida(caminho):
+    arquivo_meta = os.path.join(_pasta_cache(caminho), 'meta.json')
+    try:
+        with open(arquivo_meta, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if meta.get('assinatura') != _assinatura_arquivo(caminho):
+        return None
+    return meta
+
+
+# Grava as colunas em uma pasta temporária e troca de uma vez (escrita atômica)
+def _gravar_cache(caminho, colunas, extras=None):
+    pasta = _pasta_cache(caminho)
+    temporaria = pasta + f'.tmp{os.getpid()}'
+    try:
+        os.makedirs(temporaria, exist_ok=True)
+        for nome, valores in colunas.items():
+            np.save(os.path.join(temporaria, nome + '.npy'), valores)
+
+        meta = {'assinatura': _assinatura_arquivo(caminho), 'colunas': list(colunas)}
+        meta.update(extras or {})
+        with open(os.path.join(temporaria, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+        shutil.rmtree(pasta, ignore_errors=True)
+        os.replace(temporaria, pasta)
+    except OSError:
+        # Sem permissão de escrita: seguimos sem cache
+        shutil.rmtree(temporaria, ignore_errors=True)
+
+
+def _abrir_colunas(caminho, meta):
+    pasta = _pasta_cache(caminho)
+    return {nome: np.load(os.path.join(pasta, nome + '.npy'), mmap_mode='r') for nome in meta['colunas']}
+
+
+# Notas inteiras de 0 a 5 cabem em int8; qualquer outra coisa vira float32
+def _tipo_nota(notas):
+    if np.all(np.mod(notas, 1) == 0) and notas.min(initial=0) >= -128 and notas.max(initial=0) <= 127:
+        return np.int8
+    return np.float32
+
+
+@instrumentar('ler_avaliacoes')
+def ler_avaliacoes(caminho='DataBase/ratings.dat'):
+    meta = _ler_meta_valida(caminho)
+    if meta is None:
+        tabela = _ler_dat(caminho, ['userId', 'movieId', 'rating', 'timestamp'],
+                          dtype={'userId': np.int32, 'movieId': np.int32, 'rating': np.float64, 'timestamp': np.int64})
+        notas = tabela['rating'].to_numpy()
+        colunas = {
+            'userId': tabela['userId'].to_numpy(),
+            'movieId': tabela['movieId'].to_numpy(),
+            'rating': notas.astype(_tipo_nota(notas)),
+        }
+        _gravar_cache(caminho, colunas)
+        return pd.DataFrame(colunas)
+
+    return pd.DataFrame(_abrir_colunas(caminho, meta), copy=False)
+
+
+@instrumentar('ler_filmes')
+def ler_filmes(caminho='DataBase/movies.dat'):
+    meta = _ler_meta_valida(caminho)
+    if meta is None:
+        tabela = _ler_dat(caminho, ['movieId', 'title', 'genres'], encoding='latin-1',
+                          dtype={'movieId': np.int32, 'title': str, 'genres': str})
+        generos = pd.Categorical(tabela['genres'])
+        colunas = {
+            'movieId': tabela['movieId'].to_numpy(),
+            'title': tabela['title'].to_numpy(dtype=str),
+            'genres': generos.codes,
+        }
+        _gravar_cache(caminho, colunas, {'categorias_genres': generos.categories.tolist()})
+        tabela['genres'] = generos
+        tabela['title'] = tabela['title'].astype(TIPO_TITULO)
+        return tabela
+
+    colunas = _abrir_colunas(caminho, meta)
+    return pd.DataFrame({
+        'movieId': colunas['movieId'],
+        'title': pd.Series(colunas['title'], dtype=TIPO_TITULO),
+        'genres': pd.Categorical.from_codes(colunas['genres'], meta['categorias_genres']),
+    })
+
+
+# LEITURA EM BLOCOS (STREAMING)
+# Lê ratings.dat em pedaços de ~tamanho_bloco bytes, sempre cortando em fim de linha,
+# sem carregar o arquivo inteiro. `inicio`/`fim` restringem a leitura a uma faixa de
+# bytes: cada linha pertence à faixa em que começa (permite dividir entre processos).
+TAMANHO_BLOCO = 32 * 1024 * 1024
+TIPOS_AVALIACOES = {'userId': np.int32, 'movieId': np.int32, 'rating': np.float32, 'timestamp': np.int64}
+
+
+def ler_avaliacoes_em_blocos(caminho='DataBase/ratings.dat', tamanho_bloco=TAMANHO_BLOCO, inicio=0, fim=None):
+    fim = os.path.getsize(caminho) if fim is None else fim
+    with open(caminho, 'rb') as arquivo:
+        if inicio == 0:
+            arquivo.readline()  # cabeçalho
+        else:
+            arquivo.seek(inicio - 1)
+            arquivo.readline()  # termina a linha que começou na faixa anterior
+
+        while arquivo.tell() < fim:
+            posicao = arquivo.tell()
+            bloco = arquivo.read(tamanho_bloco)
+            if not bloco:
+                break
+            if not bloco.endswith(b'\n'):
+                bloco += arquivo.readline()
+
+            # Passou do fim da faixa: fica só até a linha que contém o byte fim-1
+            ultimo = posicao + len(bloco) >= fim
+            if ultimo:
+                corte = bloco.find(b'\n', fim - 1 - posicao) + 1
+                bloco = bloco[:corte] if corte else bloco
+
+            if bloco.strip():
+                tabela = pd.read_csv(
+                    io.BytesIO(bloco.replace(b'::', b'\t')), sep='\t', engine='c', header=None,
+                    names=list(TIPOS_AVALIACOES), dtype=TIPOS_AVALIACOES, quoting=csv.QUOTE_NONE
+                )
+                yield tabela.drop(columns=['timestamp'])
+            if ultimo:
+                break
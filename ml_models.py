@@ -1,27 +1,134 @@
+import hashlib
+import time
+import numpy as np
+import pandas as pd
 import streamlit as st
 import matplotlib.pyplot as plt
-from sklearn.cluster import KMeans
+from joblib import Parallel, delayed
+from matplotlib.lines import Line2D
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.decomposition import PCA, IncrementalPCA
 from sklearn.metrics import silhouette_score
 
+from instrumentacao import instrumentar
 
-@st.cache_resource
-def treinar_modelo(tabela_proporcao, k):
-    kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-    clusters = kmeans.fit_predict(tabela_proporcao)
+# Silhueta é O(n²): acima deste número de usuários calculamos numa amostra com semente fixa
+AMOSTRA_SILHUETA = 10000
+
+# Mapa 2D: acima deste número de usuários o PCA é ajustado em blocos (IncrementalPCA),
+# e no máximo ORCAMENTO_PONTOS pontos são desenhados
+LIMITE_PCA_COMPLETO = 200000
+ORCAMENTO_PONTOS = 5000
+
+# Resultados da varredura de K, indexados pela impressão digital da matriz de entrada
+_cache_varredura = {}
+
+
+# Motores de treinamento disponíveis:
+#  - 'kmeans': K-Means completo (n_init=10), o padrão
+#  - 'minibatch': MiniBatchKMeans sobre a matriz inteira
+#  - 'incremental': MiniBatchKMeans.partial_fit sobre blocos de linhas (usuários)
+MOTORES = ('kmeans', 'minibatch', 'incremental')
+TAMANHO_LOTE = 4096
+
+
+# Percorre a matriz em blocos de linhas, sem converter tudo de uma vez
+def _blocos_de_linhas(tabela_proporcao, tamanho_bloco):
+    for inicio in range(0, len(tabela_proporcao), tamanho_bloco):
+        yield tabela_proporcao.iloc[inicio:inicio + tamanho_bloco].to_numpy(dtype=np.float64)
+
+
+# `init` aceita centróides já prontos (ponto de partida aquecido, ver modelo_incremental.py)
+def _ajustar_incremental(tabela_proporcao, k, tamanho_lote, epocas, init='k-means++'):
+    n_init = 3 if isinstance(init, str) else 1
+    modelo = MiniBatchKMeans(n_clusters=k, init=init, random_state=42, batch_size=tamanho_lote, n_init=n_init)
+    for _ in range(epocas):
+        for bloco in _blocos_de_linhas(tabela_proporcao, tamanho_lote):
+            # O primeiro partial_fit precisa de pelo menos k linhas para iniciar os centróides
+            if not hasattr(modelo, 'cluster_centers_') and len(bloco) < k:
+                continue
+            modelo.partial_fit(bloco)
+
+    clusters = np.concatenate([modelo.predict(bloco) for bloco in _blocos_de_linhas(tabela_proporcao, tamanho_lote)])
+    return modelo, clusters
+
+
+@instrumentar('treinar_modelo', cache=st.cache_resource)
+def treinar_modelo(tabela_proporcao, k, motor='kmeans', tamanho_lote=TAMANHO_LOTE, epocas=3):
+    # Ajuste sobre ndarray, como nos blocos de calcular_inercia e do motor incremental
+    # (misturar DataFrame e ndarray faz o sklearn avisar sobre nomes de features)
+    if motor == 'kmeans':
+        kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
+        clusters = kmeans.fit_predict(tabela_proporcao.to_numpy(dtype=np.float64))
+    elif motor == 'minibatch':
+        kmeans = MiniBatchKMeans(n_clusters=k, random_state=42, batch_size=tamanho_lote, n_init=3)
+        clusters = kmeans.fit_predict(tabela_proporcao.to_numpy(dtype=np.float64))
+    elif motor == 'incremental':
+        kmeans, clusters = _ajustar_incremental(tabela_proporcao, k, tamanho_lote, epocas)
+    else:
+        raise ValueError(f"Motor de treinamento desconhecido: {motor!r} (use um de {MOTORES})")
     
     df_clusters = tabela_proporcao.copy()
     df_clusters['Cluster'] = clusters
     return kmeans, df_clusters
 
 
-@st.cache_resource
+# Inércia (WCSS) das atribuições de um modelo sobre a matriz inteira, calculada em blocos
+def calcular_inercia(modelo, tabela_proporcao, tamanho_bloco=TAMANHO_LOTE):
+    return sum(-modelo.score(bloco) for bloco in _blocos_de_linhas(tabela_proporcao, tamanho_bloco))
+
+
+# Tempo x qualidade de cada motor (inércia relativa ao K-Means completo; 1.0 = igual)
+def comparar_motores(tabela_proporcao, k, motores=MOTORES):
+    linhas = []
+    for motor in motores:
+        inicio = time.perf_counter()
+        modelo, _ = treinar_modelo.__wrapped__(tabela_proporcao, k, motor=motor)
+        tempo = time.perf_counter() - inicio
+        linhas.append({'motor': motor, 'tempo_s': tempo, 'inercia': calcular_inercia(modelo, tabela_proporcao)})
+
+    comparacao = pd.DataFrame(linhas).set_index('motor')
+    if 'kmeans' in comparacao.index:
+        comparacao['inercia_relativa'] = comparacao['inercia'] / comparacao.loc['kmeans', 'inercia']
+        comparacao['aceleracao'] = comparacao.loc['kmeans', 'tempo_s'] / comparacao['tempo_s']
+    return comparacao
+
+
+# Impressão digital da matriz (valores + rótulos) para reaproveitar a varredura
+def impressao_digital(tabela_proporcao):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(tabela_proporcao.to_numpy(dtype=np.float64)).tobytes())
+    h.update(repr((tabela_proporcao.shape, list(tabela_proporcao.columns))).encode())
+    h.update(pd.util.hash_pandas_object(tabela_proporcao.index, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _ajustar_k(dados, k, tamanho_amostra, semente):
+    km = KMeans(n_clusters=k, random_state=42, n_init=10)
+    clusters = km.fit_predict(dados)
+    amostra = tamanho_amostra if tamanho_amostra and len(dados) > tamanho_amostra else None
+    silhueta = silhouette_score(dados, clusters, sample_size=amostra, random_state=semente)
+    return k, km.inertia_, silhueta
+
+
+# Ajusta cada K uma única vez (em paralelo) e devolve inércia e silhueta de cada um
+@instrumentar('varrer_k')
+def varrer_k(tabela_proporcao, K_range=range(2, 11), tamanho_amostra=AMOSTRA_SILHUETA, semente=42, n_jobs=-1):
+    chave = (impressao_digital(tabela_proporcao), tuple(K_range), tamanho_amostra, semente)
+    if chave not in _cache_varredura:
+        dados = tabela_proporcao.to_numpy(dtype=np.float64)
+        resultados = Parallel(n_jobs=n_jobs)(
+            delayed(_ajustar_k)(dados, k, tamanho_amostra, semente) for k in K_range
+        )
+        _cache_varredura[chave] = pd.DataFrame(resultados, columns=['k', 'inercia', 'silhueta']).set_index('k')
+    return _cache_varredura[chave]
+
+
+@instrumentar('gerar_grafico_cotovelo', cache=st.cache_resource)
 def gerar_grafico_cotovelo(tabela_proporcao):
-    inercia = []
-    K_range = range(2, 11)
-    for k in K_range:
-        km = KMeans(n_clusters=k, random_state=42, n_init=10)
-        km.fit(tabela_proporcao)
-        inercia.append(km.inertia_)
+    varredura = varrer_k(tabela_proporcao)
+    K_range = varredura.index
+    inercia = varredura['inercia']
     
     fig, ax = plt.subplots(figsize=(8, 5))
     ax.plot(K_range, inercia, marker='o', color='#1f77b4', linewidth=2, markersize=8)
@@ -32,14 +139,11 @@ def gerar_grafico_cotovelo(tabela_proporcao):
     plt.tight_layout()
     return fig
 
-@st.cache_resource
+@instrumentar('gerar_grafico_silhueta', cache=st.cache_resource)
 def gerar_grafico_silhueta(tabela_proporcao):
-    silhueta = []
-    K_range = range(2, 11)
-    for k in K_range:
-        km = KMeans(n_clusters=k, random_state=42, n_init=10)
-        clusters = km.fit_predict(tabela_proporcao)
-        silhueta.append(silhouette_score(tabela_proporcao, clusters))
+    varredura = varrer_k(tabela_proporcao)
+    K_range = varredura.index
+    silhueta = varredura['silhueta']
     
     fig, ax = plt.subplots(figsize=(8, 5))
     ax.plot(K_range, silhueta, marker='s', color='#2ca02c', linewidth=2, markersize=8)
@@ -49,3 +153,74 @@ def gerar_grafico_silhueta(tabela_proporcao):
     ax.grid(True, linestyle='--', alpha=0.6)
     plt.tight_layout()
     return fig
+
+
+# PROJEÇÃO 2D (PCA) DO MAPA DE CLUSTERS
+# Ajustada uma única vez por modelo treinado (cache pelo df_clusters)
+@instrumentar('calcular_projecao', cache=st.cache_resource)
+def calcular_projecao(df_clusters):
+    dados = df_clusters.drop(columns=['Cluster'])
+    if len(dados) <= LIMITE_PCA_COMPLETO:
+        pca = PCA(n_components=2, svd_solver='randomized', random_state=42)
+        return pca.fit_transform(dados.to_numpy(dtype=np.float64)).astype(np.float32)
+
+    pca = IncrementalPCA(n_components=2)
+    for bloco in _blocos_de_linhas(dados, 50000):
+        if len(bloco) >= 2:
+            pca.partial_fit(bloco)
+    return np.concatenate([pca.transform(bloco) for bloco in _blocos_de_linhas(dados, 50000)]).astype(np.float32)
+
+
+# Amostra estratificada: cada cluster recebe uma fatia do orçamento proporcional ao seu
+# tamanho (no mínimo 1 ponto). O índice obrigatório (usuário alvo) sempre entra.
+def amostrar_por_cluster(clusters, orcamento=ORCAMENTO_PONTOS, indice_obrigatorio=None, semente=42):
+    clusters = np.asarray(clusters)
+    if len(clusters) <= orcamento:
+        return np.arange(len(clusters))
+
+    rng = np.random.default_rng(semente)
+    escolhidos = []
+    for cluster in np.unique(clusters):
+        membros = np.flatnonzero(clusters == cluster)
+        cota = max(1, int(round(orcamento * len(membros) / len(clusters))))
+        escolhidos.append(rng.choice(membros, size=min(cota, len(membros)), replace=False))
+
+    escolhidos = np.concatenate(escolhidos)
+    if indice_obrigatorio is not None:
+        escolhidos = np.union1d(escolhidos, [indice_obrigatorio])
+    return np.sort(escolhidos)
+
+
+# modo='amostra': dispersão com amostra estratificada por cluster
+# modo='densidade': hexbin com todos os usuários + centro de cada cluster
+def gerar_mapa_clusters(componentes, clusters, indice_alvo, paleta, cor_alvo,
+                        orcamento_pontos=ORCAMENTO_PONTOS, modo='amostra'):
+    clusters = np.asarray(clusters)
+    fig, ax = plt.subplots(figsize=(5, 3))
+
+    if modo == 'densidade':
+        ax.hexbin(componentes[:, 0], componentes[:, 1], gridsize=40, bins='log', cmap='Greys', mincnt=1)
+        for cluster in np.unique(clusters):
+            centro = np.median(componentes[clusters == cluster], axis=0)
+            ax.scatter(centro[0], centro[1], c=paleta[cluster], s=80, edgecolors='black', zorder=4)
+    else:
+        amostra = amostrar_por_cluster(clusters, orcamento_pontos, indice_alvo)
+        cores_pontos = [paleta[c] for c in clusters[amostra]]
+        ax.scatter(componentes[amostra, 0], componentes[amostra, 1], c=cores_pontos, alpha=0.5)
+
+    ax.scatter(componentes[indice_alvo, 0], componentes[indice_alvo, 1], c=cor_alvo, s=150, edgecolors='black', marker='.', zorder=5)
+
+    ax.set_xlabel('Gostos Majoritários', fontsize=10)
+    ax.set_ylabel('Gostos Secundários', fontsize=10)
+    ax.grid(True, linestyle='--', alpha=0.3)
+
+    elementos_legenda = [Line2D([0], [0], marker='o', color='w', label=f'cluster {i}',
+                                markerfacecolor=paleta[i], markersize=8)
+                         for i in sorted(np.unique(clusters))]
+    elementos_legenda.append(Line2D([0], [0], marker='.', color='w', label='Usuário Alvo',
+                                    markerfacecolor=cor_alvo, markersize=15, markeredgecolor='black'))
+
+    ax.legend(handles=elementos_legenda, title="clusters", loc='center left', bbox_to_anchor=(1, 0.5), fontsize='small')
+    fig.tight_layout()
+    return fig
+
@@ -0,0 +1,283 @@
+import copy
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans, MiniBatchKMeans
+
+from ml_models import treinar_modelo, impressao_digital, calcular_inercia, _ajustar_incremental, TAMANHO_LOTE
+
+# MANUTENÇÃO INCREMENTAL DO MODELO
+#
+# 1) Troca de K: em vez de treinar do zero, partimos do modelo já treinado com o K
+#    mais próximo, dividindo (K maior) ou juntando (K menor) centróides, e ajustamos
+#    só a partir desses centróides (n_init=1). Checagem barata: um bom ajuste não tem
+#    inércia maior que um modelo guardado com menos clusters, então se a inércia do
+#    aquecido passar da menor inércia guardada com K' <= K (mais uma tolerância), ou
+#    se não houver nenhum K' <= K para comparar, cai para o treino normal (frio).
+# 2) Novas avaliações: só as linhas dos usuários afetados são recalculadas; os
+#    centróides são ajustados online e o retreino completo só acontece quando a
+#    deriva (aumento relativo da inércia) passa de um limiar configurável.
+
+LIMIAR_DERIVA = 0.10
+TOLERANCIA_AQUECIDO = 0.0
+MODELOS_GUARDADOS = 8
+
+# Origem do modelo servido: treino normal ou centróides ajustados de outro K
+ORIGEM_FRIO = 'frio'
+ORIGEM_AQUECIDO = 'aquecido'
+
+# impressão digital da matriz -> {(motor, k): (modelo, df_clusters, origem, inercia)}
+_modelos_treinados = {}
+
+
+# K maior: divide o cluster com maior soma de distâncias², usando como novo
+# centróide o membro mais distante do centróide atual
+def _dividir_centroides(dados, rotulos, centroides, k_novo):
+    centroides = [c for c in centroides]
+    rotulos = rotulos.copy()
+    while len(centroides) < k_novo:
+        atuais = np.asarray(centroides)
+        distancias = ((dados - atuais[rotulos]) ** 2).sum(axis=1)
+        sse = np.bincount(rotulos, weights=distancias, minlength=len(centroides))
+        alvo = int(np.argmax(sse))
+        membros = np.flatnonzero(rotulos == alvo)
+
+        novo_rotulo = len(centroides)
+        if sse[alvo] == 0:
+            # Tudo já coincide com os centróides: duplica um ponto qualquer
+            centroides.append(dados[len(centroides) % len(dados)].copy())
+            continue
+
+        centroides.append(dados[membros[np.argmax(distancias[membros])]].copy())
+        # Redistribui só os membros do cluster dividido entre os dois centróides
+        perto_do_novo = ((dados[membros] - centroides[-1]) ** 2).sum(axis=1) < distancias[membros]
+        rotulos[membros[perto_do_novo]] = novo_rotulo
+        for rotulo in (alvo, novo_rotulo):
+            selecionados = rotulos == rotulo
+            if selecionados.any():
+                centroides[rotulo] = dados[selecionados].mean(axis=0)
+    return np.asarray(centroides)
+
+
+# K menor: junta repetidamente os dois centróides mais próximos (média ponderada)
+def _juntar_centroides(centroides, tamanhos, k_novo):
+    centroides = centroides.astype(np.float64).copy()
+    tamanhos = tamanhos.astype(np.float64).copy()
+    while len(centroides) > k_novo:
+        distancias = ((centroides[:, None, :] - centroides[None, :, :]) ** 2).sum(axis=2)
+        np.fill_diagonal(distancias, np.inf)
+        i, j = sorted(np.unravel_index(np.argmin(distancias), distancias.shape))
+        peso = tamanhos[i] + tamanhos[j]
+        if peso > 0:
+            centroides[i] = (centroides[i] * tamanhos[i] + centroides[j] * tamanhos[j]) / peso
+        tamanhos[i] = peso
+        centroides = np.delete(centroides, j, axis=0)
+        tamanhos = np.delete(tamanhos, j)
+    return centroides
+
+
+# `dados` só é usado para dividir; pode ser uma função que devolve a matriz densa
+def ajustar_centroides(dados, rotulos, centroides, k_novo):
+    if k_novo > len(centroides):
+        dados = dados() if callable(dados) else dados
+        return _dividir_centroides(dados, rotulos, centroides, k_novo)
+    tamanhos = np.bincount(rotulos, minlength=len(centroides))
+    return _juntar_centroides(centroides, tamanhos, k_novo)
+
+
+# (modelo, clusters) partindo dos centróides dados; o motor 'incremental' segue
+# em blocos com partial_fit, como no treino normal
+def _ajustar_aquecido(tabela_proporcao, motor, k, centroides):
+    if motor == 'incremental':
+        return _ajustar_incremental(tabela_proporcao, k, TAMANHO_LOTE, epocas=3, init=centroides)
+    if motor == 'kmeans':
+        modelo = KMeans(n_clusters=k, init=centroides, n_init=1, random_state=42)
+    else:
+        modelo = MiniBatchKMeans(n_clusters=k, init=centroides, n_init=1, random_state=42, batch_size=TAMANHO_LOTE)
+    return modelo, modelo.fit_predict(tabela_proporcao.to_numpy(dtype=np.float64))
+
+
+# Mesmo contrato de treinar_modelo: (modelo, df_clusters)
+def treinar_modelo_aquecido(tabela_proporcao, k, motor='kmeans'):
+    modelo, df_clusters, _ = treinar_com_origem(tabela_proporcao, k, motor)
+    return modelo, df_clusters
+
+
+# Inércia sobre a matriz inteira; o motor incremental só conhece a do último bloco
+def _inercia(modelo, tabela_proporcao, motor):
+    if motor == 'incremental':
+        return calcular_inercia(modelo, tabela_proporcao)
+    return float(modelo.inertia_)
+
+
+# Teto para a inércia do ajuste aquecido (None se não houver modelo guardado com K' <= k)
+def _limite_aquecido(registro, motor, k, tolerancia):
+    tetos = [inercia for (m, k_treinado), (_, _, _, inercia) in registro.items() if m == motor and k_treinado <= k]
+    return min(tetos) * (1 + tolerancia) if tetos else None
+
+
+# (modelo, df_clusters, origem). Parte dos centróides do modelo guardado com o K
+# mais próximo e só treina do zero se a checagem de inércia falhar.
+def treinar_com_origem(tabela_proporcao, k, motor='kmeans', tolerancia=TOLERANCIA_AQUECIDO):
+    registro = _modelos_treinados.setdefault(impressao_digital(tabela_proporcao), {})
+    if (motor, k) in registro:
+        return registro[(motor, k)][:3]
+
+    resultado = None
+    limite = _limite_aquecido(registro, motor, k, tolerancia)
+    if limite is not None:
+        vizinhos = [k_treinado for (m, k_treinado) in registro if m == motor]
+        k_base = min(vizinhos, key=lambda k_treinado: (abs(k_treinado - k), k_treinado))
+        modelo_base, df_base, _, _ = registro[(motor, k_base)]
+        centroides = ajustar_centroides(lambda: tabela_proporcao.to_numpy(dtype=np.float64),
+                                        df_base['Cluster'].to_numpy(), modelo_base.cluster_centers_, k)
+
+        modelo, clusters = _ajustar_aquecido(tabela_proporcao, motor, k, centroides)
+        inercia = _inercia(modelo, tabela_proporcao, motor)
+        if inercia <= limite:
+            df_clusters = tabela_proporcao.copy()
+            df_clusters['Cluster'] = clusters
+            resultado = (modelo, df_clusters, ORIGEM_AQUECIDO, inercia)
+
+    if resultado is None:
+        modelo, df_clusters = treinar_modelo.__wrapped__(tabela_proporcao, k, motor=motor)
+        resultado = (modelo, df_clusters, ORIGEM_FRIO, _inercia(modelo, tabela_proporcao, motor))
+
+    registro[(motor, k)] = resultado
+    while len(registro) > MODELOS_GUARDADOS:
+        registro.pop(next(iter(registro)))
+    return resultado[:3]
+
+
+# ESTADO INCREMENTAL (NOVAS AVALIAÇÕES)
+class EstadoIncremental:
+
+    def __init__(self, matrizes, modelo, df_clusters, limiar_deriva=LIMIAR_DERIVA):
+        self.generos = [g for g in df_clusters.columns if g != 'Cluster']
+        colunas = pd.Index(matrizes.generos).get_indexer(self.generos)
+
+        self.usuarios = list(df_clusters.index)
+        self._linha_usuario = {usuario: i for i, usuario in enumerate(self.usuarios)}
+        self._coluna_filme = {filme: j for j, filme in enumerate(matrizes.filmes)}
+
+        # Linhas de matrizes seguem a ordem de df_clusters (ambas vêm de ratings.dat)
+        linhas = pd.Index(matrizes.usuarios).get_indexer(df_clusters.index)
+        self.contagem = np.zeros((len(self.usuarios), len(self.generos)))
+        encontrados = linhas >= 0
+        self.contagem[encontrados] = matrizes.contagem_generos[linhas[encontrados]].toarray()
+        self.incidencia = np.zeros((len(matrizes.filmes), len(self.generos)))
+        presentes = colunas >= 0
+        self.incidencia[:, presentes] = matrizes.incidencia[:, colunas[presentes]].toarray()
+
+        self._avaliacoes = matrizes.avaliacoes.tocsr()
+        self._avaliacoes.sort_indices()
+        self._linha_matriz = dict(zip(matrizes.usuarios, range(len(matrizes.usuarios))))
+        self._alteradas = {}
+
+        # Cópia: o modelo original pode estar no cache do Streamlit
+        self.modelo = copy.deepcopy(modelo)
+        self.limiar_deriva = limiar_deriva
+        self._reiniciar(modelo.cluster_centers_, df_clusters['Cluster'].to_numpy())
+
+    def _reiniciar(self, centroides, rotulos):
+        self.centroides = np.array(centroides, dtype=np.float64)
+        self.rotulos = np.array(rotulos, dtype=np.int64)
+        self.tamanhos = np.bincount(self.rotulos, minlength=len(self.centroides)).astype(np.float64)
+        self.modelo.cluster_centers_ = self.centroides.copy()
+        self.inercia_treino = self.inercia()
+
+    def proporcao(self, linhas=slice(None)):
+        contagem = self.contagem[linhas]
+        total = contagem.sum(axis=-1, keepdims=True)
+        return np.divide(contagem, total, out=np.zeros_like(contagem), where=total > 0)
+
+    def inercia(self):
+        dados = self.proporcao()
+        return float(((dados - self.centroides[self.rotulos]) ** 2).sum())
+
+    # Aumento relativo da inércia desde o último treino completo
+    def deriva(self):
+        if self.inercia_treino <= 0:
+            return 0.0
+        return self.inercia() / self.inercia_treino - 1.0
+
+    def _nota_atual(self, usuario, coluna):
+        if (usuario, coluna) in self._alteradas:
+            return self._alteradas[(usuario, coluna)]
+        linha = self._linha_matriz.get(usuario)
+        if linha is None:
+            return 0.0
+        inicio, fim = self._avaliacoes.indptr[linha], self._avaliacoes.indptr[linha + 1]
+        posicao = inicio + np.searchsorted(self._avaliacoes.indices[inicio:fim], coluna)
+        if posicao < fim and self._avaliacoes.indices[posicao] == coluna:
+            return float(self._avaliacoes.data[posicao])
+        return 0.0
+
+    def _novo_usuario(self, usuario):
+        self._linha_usuario[usuario] = len(self.usuarios)
+        self.usuarios.append(usuario)
+        self.contagem = np.vstack([self.contagem, np.zeros((1, len(self.generos)))])
+        self.rotulos = np.append(self.rotulos, -1)
+        return self._linha_usuario[usuario]
+
+    # Aplica avaliações novas ou alteradas (DataFrame com userId, movieId, rating)
+    def aplicar_avaliacoes(self, novas):
+        afetados = {}
+        for usuario, filme, nota in novas[['userId', 'movieId', 'rating']].itertuples(index=False):
+            coluna = self._coluna_filme.get(filme)
+            if coluna is None:
+                continue  # filme fora do catálogo (mesmo comportamento do merge)
+
+            linha = self._linha_usuario.get(usuario)
+            if linha is None:
+                linha = self._novo_usuario(usuario)
+            if linha not in afetados:
+                afetados[linha] = self.proporcao(linha).copy()
+
+            anterior = self._nota_atual(usuario, coluna)
+            variacao = float(nota >= 3.0) - float(anterior >= 3.0)
+            if variacao:
+                self.contagem[linha] += variacao * self.incidencia[coluna]
+            self._alteradas[(usuario, coluna)] = float(nota)
+
+        # Atualização online: tira o ponto antigo do centróide antigo e soma o novo no mais próximo
+        for linha, antigo in afetados.items():
+            cluster_antigo = self.rotulos[linha]
+            if cluster_antigo >= 0:
+                n = self.tamanhos[cluster_antigo]
+                if n > 1:
+                    self.centroides[cluster_antigo] = (self.centroides[cluster_antigo] * n - antigo) / (n - 1)
+                self.tamanhos[cluster_antigo] = n - 1
+
+            novo = self.proporcao(linha)
+            cluster_novo = int(np.argmin(((self.centroides - novo) ** 2).sum(axis=1)))
+            self.tamanhos[cluster_novo] += 1
+            self.centroides[cluster_novo] += (novo - self.centroides[cluster_novo]) / self.tamanhos[cluster_novo]
+            self.rotulos[linha] = cluster_novo
+
+        self.modelo.cluster_centers_ = self.centroides.copy()
+        deriva = self.deriva()
+        retreinado = deriva > self.limiar_deriva
+        if retreinado:
+            self.retreinar()
+
+        return {'usuarios_afetados': [self.usuarios[linha] for linha in afetados],
+                'deriva': deriva, 'retreinado': retreinado}
+
+    # Retreino completo com o mesmo K (zera a deriva)
+    def retreinar(self):
+        self.modelo = KMeans(n_clusters=len(self.centroides), random_state=42, n_init=10)
+        rotulos = self.modelo.fit_predict(self.proporcao())
+        self._reiniciar(self.modelo.cluster_centers_, rotulos)
+
+    def tabela_proporcao(self):
+        return pd.DataFrame(
+            self.proporcao(),
+            index=pd.Index(self.usuarios, name='userId'),
+            columns=pd.Index(self.generos, name='genres'),
+        )
+
+    def df_clusters(self):
+        df_clusters = self.tabela_proporcao()
+        df_clusters['Cluster'] = self.rotulos
+        return df_clusters
@@ -0,0 +1,156 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from recommender import ranquear_filmes
+
+# RECOMENDAÇÃO EM LOTE (TODOS OS USUÁRIOS DE UMA VEZ)
+#
+# Em vez de chamar recomendar_filmes usuário por usuário, cada cluster é agregado
+# uma única vez e o top-N de todos os seus usuários sai de uma só operação
+# vetorizada. Cada cluster é uma "fatia" independente, então pode ir para um
+# processo separado.
+
+COLUNAS_SAIDA = ['userId', 'Cluster', 'posicao', 'movieId', 'title', 'genres',
+                 'nota_media_cluster', 'contagem_avaliacoes']
+
+# Quantos usuários entram em cada bloco da matriz usuários x ranking (limita a memória)
+USUARIOS_POR_BLOCO = 4096
+
+
+# Top-N de todos os usuários de um cluster.
+# Para cada usuário marcamos numa matriz booleana quais posições do ranking ele já viu;
+# a soma acumulada das posições não vistas dá a posição da recomendação.
+def _recomendar_cluster(cluster, usuarios, avaliacoes, top_n, min_avaliacoes):
+    ranking = ranquear_filmes(avaliacoes, min_avaliacoes)
+    filmes_ranking = ranking['movieId'].to_numpy()
+    if len(filmes_ranking) == 0 or len(usuarios) == 0:
+        return pd.DataFrame(columns=['userId', 'Cluster', 'posicao', 'movieId',
+                                     'nota_media_cluster', 'contagem_avaliacoes'])
+
+    # Posição no ranking de cada filme visto (-1 se o filme nem está no ranking)
+    linha_usuario = pd.Index(usuarios).get_indexer(avaliacoes['userId'])
+    posicao_visto = pd.Index(filmes_ranking).get_indexer(avaliacoes['movieId'])
+    no_ranking = (posicao_visto >= 0) & (linha_usuario >= 0)
+    linha_usuario, posicao_visto = linha_usuario[no_ranking], posicao_visto[no_ranking]
+
+    # Só é preciso olhar top_n + (vistos dentro do ranking) posições
+    vistos_por_usuario = np.bincount(linha_usuario, minlength=len(usuarios))
+    largura = int(min(len(filmes_ranking), top_n + vistos_por_usuario.max(initial=0)))
+    dentro = posicao_visto < largura
+    linha_usuario, posicao_visto = linha_usuario[dentro], posicao_visto[dentro]
+
+    ordem = np.argsort(linha_usuario, kind='stable')
+    linha_usuario, posicao_visto = linha_usuario[ordem], posicao_visto[ordem]
+    inicios = np.searchsorted(linha_usuario, np.arange(0, len(usuarios) + USUARIOS_POR_BLOCO, USUARIOS_POR_BLOCO))
+
+    linhas_saida, posicoes_saida = [], []
+    for bloco, inicio in enumerate(range(0, len(usuarios), USUARIOS_POR_BLOCO)):
+        fim = min(inicio + USUARIOS_POR_BLOCO, len(usuarios))
+        a, b = inicios[bloco], inicios[bloco + 1]
+
+        visto = np.zeros((fim - inicio, largura), dtype=bool)
+        visto[linha_usuario[a:b] - inicio, posicao_visto[a:b]] = True
+
+        nao_visto = ~visto
+        posicao_recomendacao = np.cumsum(nao_visto, axis=1)
+        linhas, posicoes = np.nonzero(nao_visto & (posicao_recomendacao <= top_n))
+        linhas_saida.append(linhas + inicio)
+        posicoes_saida.append(posicoes)
+
+    linhas = np.concatenate(linhas_saida)
+    posicoes = np.concatenate(posicoes_saida)
+    # Posição (1..top_n) da recomendação dentro da lista do usuário
+    _, primeiro = np.unique(linhas, return_index=True)
+    posicao_na_lista = np.arange(len(linhas)) - np.repeat(primeiro, np.diff(np.append(primeiro, len(linhas)))) + 1
+
+    resultado = ranking.iloc[posicoes].reset_index(drop=True)
+    resultado.insert(0, 'posicao', posicao_na_lista)
+    resultado.insert(0, 'Cluster', cluster)
+    resultado.insert(0, 'userId', np.asarray(usuarios)[linhas])
+    return resultado
+
+
+def _tarefa_cluster(argumentos):
+    return _recomendar_cluster(*argumentos)
+
+
+# Gera uma fatia (cluster, usuários, avaliações) por cluster, sem copiar strings
+def _fatias_por_cluster(df_clusters, df_dados_originais, top_n, min_avaliacoes):
+    avaliacoes = df_dados_originais[['userId', 'movieId', 'rating']]
+    cluster_da_avaliacao = avaliacoes['userId'].map(df_clusters['Cluster'])
+
+    for cluster, usuarios in df_clusters.groupby('Cluster').groups.items():
+        yield (int(cluster), np.asarray(usuarios),
+               avaliacoes[cluster_da_avaliacao == cluster], top_n, min_avaliacoes)
+
+
+# Top-N de todos os usuários, devolvido cluster a cluster (um DataFrame por cluster)
+def recomendar_todos(df_clusters, df_dados_originais, df_filmes, top_n=5, min_avaliacoes=3, processos=1):
+    fatias = _fatias_por_cluster(df_clusters, df_dados_originais, top_n, min_avaliacoes)
+    filmes = df_filmes[['movieId', 'title', 'genres']]
+
+    if processos > 1:
+        with ProcessPoolExecutor(max_workers=processos) as executor:
+            for resultado in executor.map(_tarefa_cluster, fatias):
+                yield resultado.merge(filmes, on='movieId', how='left')[COLUNAS_SAIDA]
+    else:
+        for fatia in fatias:
+            yield _tarefa_cluster(fatia).merge(filmes, on='movieId', how='left')[COLUNAS_SAIDA]
+
+
+# Grava os blocos conforme ficam prontos (Parquet ou CSV, pela extensão do arquivo)
+def gravar_recomendacoes(blocos, caminho):
+    total = 0
+    if caminho.endswith('.parquet'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        escritor = None
+        try:
+            for bloco in blocos:
+                bloco = bloco.astype({'title': str, 'genres': str})
+                tabela = pa.Table.from_pandas(bloco, preserve_index=False)
+                if escritor is None:
+                    escritor = pq.ParquetWriter(caminho, tabela.schema)
+                escritor.write_table(tabela.cast(escritor.schema))
+                total += len(bloco)
+        finally:
+            if escritor is not None:
+                escritor.close()
+    else:
+        primeiro = True
+        for bloco in blocos:
+            bloco.to_csv(caminho, mode='w' if primeiro else 'a', header=primeiro, index=False)
+            primeiro = False
+            total += len(bloco)
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Gera as recomendações de todos os usuários (sem Streamlit).')
+    parser.add_argument('--k', type=int, default=5, help='quantidade de clusters do K-Means')
+    parser.add_argument('--top-n', type=int, default=10, help='filmes recomendados por usuário')
+    parser.add_argument('--min-avaliacoes', type=int, default=3)
+    parser.add_argument('--processos', type=int, default=1, help='processos em paralelo (um cluster por tarefa)')
+    parser.add_argument('--diretorio', default='DataBase', help='pasta com movies.dat e ratings.dat')
+    parser.add_argument('--saida', default='recomendacoes.parquet', help='arquivo .parquet ou .csv')
+    args = parser.parse_args(argv)
+
+    from data_processing import carregar_dados
+    from ml_models import treinar_modelo
+
+    movies, _, tabela_completa, tabela_proporcao = carregar_dados(args.diretorio)
+    _, df_clusters = treinar_modelo(tabela_proporcao, k=args.k)
+
+    blocos = recomendar_todos(df_clusters, tabela_completa, movies, top_n=args.top_n,
+                              min_avaliacoes=args.min_avaliacoes, processos=args.processos)
+    total = gravar_recomendacoes(blocos, args.saida)
+    print(f'{total} recomendações gravadas em {os.path.abspath(args.saida)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,20 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+from data_processing import anexar_filmes, construir_incidencia_generos
+from instrumentacao import instrumentar
 
-def gerar_relatorio(usuario_alvo, df_ratings, df_movies):
+
+
+@instrumentar('gerar_relatorio', linhas=lambda r: len(r[3]))
+def gerar_relatorio(usuario_alvo, df_ratings, df_movies, indice_avaliacoes=None):
+    # Com o índice por usuário: fatia direta + resumo pré-calculado (sem varrer a tabela)
+    if indice_avaliacoes is not None:
+        total, media, generos_top = indice_avaliacoes.resumo(usuario_alvo)
+        filmes_vistos = indice_avaliacoes.avaliacoes_do_usuario(usuario_alvo).merge(df_movies, on='movieId', how='left')
+        top_filmes = filmes_vistos.sort_values(by='rating', ascending=False)
+        return total, media, generos_top, top_filmes
+    
     avaliacoes = df_ratings[df_ratings['userId'] == usuario_alvo]
     filmes_vistos = avaliacoes.merge(df_movies, on='movieId', how='left')
     
@@ -18,7 +33,8 @@ def gerar_relatorio(usuario_alvo, df_ratings, df_movies):
 
 # Recomenda filmes para um usuário com base no gosto do seu cluster,
 # priorizando os filmes mais assistidos (populares) com as melhores notas.
-def recomendar_filmes(usuario_alvo, df_clusters, df_dados_originais, df_filmes, top_n=5, min_avaliacoes=3):
+@instrumentar('recomendar_filmes')
+def recomendar_filmes(usuario_alvo, df_clusters, df_dados_originais, df_filmes, top_n=5, min_avaliacoes=3, indice_avaliacoes=None):
     
     if usuario_alvo not in df_clusters.index:
         return None
@@ -30,7 +46,10 @@ def recomendar_filmes(usuario_alvo, df_clusters, df_dados_originais, df_filmes,
     usuarios_do_cluster = df_clusters[df_clusters['Cluster'] == cluster_do_usuario].index
     
     # Lista com os filmes vistos pelo usuários indo pegar na tabela com todos os dados
-    filmes_vistos_pelo_alvo = df_dados_originais[df_dados_originais['userId'] == usuario_alvo]['movieId'].unique()
+    if indice_avaliacoes is not None:
+        filmes_vistos_pelo_alvo = indice_avaliacoes.avaliacoes_do_usuario(usuario_alvo)['movieId'].unique()
+    else:
+        filmes_vistos_pelo_alvo = df_dados_originais[df_dados_originais['userId'] == usuario_alvo]['movieId'].unique()
     
     avaliacoes_do_cluster = df_dados_originais[df_dados_originais['userId'].isin(usuarios_do_cluster)]
     
@@ -39,7 +58,7 @@ def recomendar_filmes(usuario_alvo, df_clusters, df_dados_originais, df_filmes,
     avaliacoes_unicas = avaliacoes_validas.drop_duplicates(subset=['userId', 'movieId', 'rating'])
     
     # Media e quantas pessoas avaliaram os filmes
-    filmes_agrupados = avaliacoes_unicas.groupby(['movieId', 'title']).agg(
+    filmes_agrupados = avaliacoes_unicas.groupby('movieId').agg(
         nota_media_cluster=('rating', 'mean'),
         contagem_avaliacoes=('rating', 'count')
     ).reset_index() # volta para ser representado em colunas
@@ -53,8 +72,13 @@ def recomendar_filmes(usuario_alvo, df_clusters, df_dados_originais, df_filmes,
         ascending=[False, False]
     ).head(top_n)
     
-    # JoinLeft das tabelas para trazer mais informação
-    top_filmes_com_generos = top_filmes.merge(df_filmes[['movieId', 'genres']], on='movieId', how='left')
+    return _formatar_recomendacoes(top_filmes, df_filmes)
+
+
+def _formatar_recomendacoes(top_filmes, df_filmes):
+    # JoinLeft só nas linhas finais para trazer título (se ainda não veio do ranking) e gêneros
+    colunas = ('genres',) if 'title' in top_filmes.columns else ('title', 'genres')
+    top_filmes_com_generos = anexar_filmes(top_filmes, df_filmes, colunas)
     
     # Renomeando as colunas
     top_filmes_com_generos = top_filmes_com_generos.rename(columns={
@@ -64,6 +88,159 @@ def recomendar_filmes(usuario_alvo, df_clusters, df_dados_originais, df_filmes,
     
     return top_filmes_com_generos[['Título', 'Gêneros', 'Nota Média do cluster', 'Qtd. Avaliações']]
 
+
+# Média e contagem por filme (avaliações repetidas contam uma vez), já filtradas
+# e ordenadas como em recomendar_filmes. `por` agrupa antes do filme (ex.: Cluster).
+@instrumentar('ranquear_filmes')
+def ranquear_filmes(avaliacoes, min_avaliacoes=3, por=()):
+    chaves = list(por) + ['movieId']
+    
+    avaliacoes_unicas = avaliacoes.drop_duplicates(subset=['userId', 'movieId', 'rating'])
+    filmes_agrupados = avaliacoes_unicas.groupby(chaves).agg(
+        nota_media_cluster=('rating', 'mean'),
+        contagem_avaliacoes=('rating', 'count')
+    ).reset_index()
+    
+    filmes_excelentes = filmes_agrupados[
+        (filmes_agrupados['contagem_avaliacoes'] >= min_avaliacoes) &
+        (filmes_agrupados['nota_media_cluster'] >= 3.0)
+    ]
+    # Ordenação estável: empates continuam por movieId, como no groupby original
+    return filmes_excelentes.sort_values(
+        by=list(por) + ['contagem_avaliacoes', 'nota_media_cluster'],
+        ascending=[True] * len(por) + [False, False], kind='stable'
+    ).reset_index(drop=True)
+
+
+# ÍNDICE DE RECOMENDAÇÃO POR CLUSTER
+# Calcula uma única vez (por modelo treinado) o ranking de filmes de cada cluster,
+# já filtrado e ordenado como em recomendar_filmes. Os argumentos com "_" não são
+# hasheados pelo Streamlit: o índice fica atrelado ao df_clusters (ou seja, ao K).
+@instrumentar('construir_indice_recomendacao', cache=st.cache_resource, linhas=lambda r: len(r['cluster_do_usuario']))
+def construir_indice_recomendacao(df_clusters, _df_dados_originais, _df_filmes, min_avaliacoes=3):
+    avaliacoes = _df_dados_originais[['userId', 'movieId', 'rating']]
+    avaliacoes = avaliacoes.assign(Cluster=avaliacoes['userId'].map(df_clusters['Cluster']))
+    avaliacoes = avaliacoes.dropna(subset=['Cluster'])
+    
+    # A exclusão dos filmes já vistos só remove filmes inteiros do agrupamento,
+    # então as estatísticas por (cluster, filme) não dependem do usuário alvo
+    filmes_excelentes = ranquear_filmes(avaliacoes, min_avaliacoes, por=['Cluster'])
+    filmes_excelentes = filmes_excelentes.merge(_df_filmes[['movieId', 'title']], on='movieId', how='left')
+    
+    ranking = {
+        int(cluster): grupo[['movieId', 'title', 'nota_media_cluster', 'contagem_avaliacoes']].reset_index(drop=True)
+        for cluster, grupo in filmes_excelentes.groupby('Cluster', sort=False)
+    }
+    
+    # Filmes já vistos por cada usuário, para pular no momento de servir
+    vistos = avaliacoes.groupby('userId')['movieId'].unique()
+    
+    return {
+        'cluster_do_usuario': df_clusters['Cluster'],
+        'ranking': ranking,
+        'vistos': vistos,
+        'filmes': _df_filmes,
+    }
+
+
+# Mesmo resultado de recomendar_filmes, mas só percorre o começo do ranking do cluster
+@instrumentar('recomendar_filmes_indexado')
+def recomendar_filmes_indexado(usuario_alvo, indice, top_n=5):
+    
+    if usuario_alvo not in indice['cluster_do_usuario'].index:
+        return None
+    
+    cluster_do_usuario = int(indice['cluster_do_usuario'].loc[usuario_alvo])
+    vistos = indice['vistos'].get(usuario_alvo, np.array([], dtype=np.int64))
+    
+    return _servir_do_ranking(indice, cluster_do_usuario, vistos, top_n)
+
+
+def _servir_do_ranking(indice, cluster, vistos, top_n):
+    ranking = indice['ranking'].get(cluster)
+    if ranking is None:
+        ranking = pd.DataFrame(columns=['movieId', 'title', 'nota_media_cluster', 'contagem_avaliacoes'])
+    
+    # No pior caso todos os vistos estão no topo: basta olhar top_n + len(vistos) filmes
+    candidatos = ranking.head(top_n + len(vistos))
+    top_filmes = candidatos[~candidatos['movieId'].isin(vistos)].head(top_n)
+    
+    return _formatar_recomendacoes(top_filmes, indice['filmes'])
+
+
+# Recomendação do índice do cluster, reordenada pelos vizinhos: os `candidatos` primeiros
+# filmes não vistos recebem pontuação (1 - peso) x popularidade + peso x afinidade, onde a
+# popularidade é a contagem no cluster relativa ao mais avaliado dos candidatos.
+# `indice_vizinhos` é um vizinhos.IndiceVizinhos (busca dos k usuários mais parecidos).
+@instrumentar('recomendar_com_vizinhos')
+def recomendar_com_vizinhos(usuario_alvo, indice, indice_vizinhos, top_n=5, k=50,
+                            candidatos=200, peso=0.5, orcamento_ms=50.0):
+    if usuario_alvo not in indice['cluster_do_usuario'].index:
+        return None
+
+    cluster = int(indice['cluster_do_usuario'].loc[usuario_alvo])
+    vistos = indice['vistos'].get(usuario_alvo, np.array([], dtype=np.int64))
+    ranking = indice['ranking'].get(cluster)
+    if ranking is None or ranking.empty:
+        return _servir_do_ranking(indice, cluster, vistos, top_n)
+
+    lista = ranking.head(candidatos + len(vistos))
+    lista = lista[~lista['movieId'].isin(vistos)].head(candidatos)
+
+    vizinhos, similaridades = indice_vizinhos.vizinhos(usuario_alvo, k, orcamento_ms)
+    afinidade = indice_vizinhos.afinidade(vizinhos, similaridades, lista['movieId'].to_numpy())
+    popularidade = lista['contagem_avaliacoes'].to_numpy() / max(lista['contagem_avaliacoes'].max(), 1)
+    pontuacao = (1 - peso) * popularidade + peso * afinidade
+
+    # Empate: vale a ordem original do ranking do cluster
+    ordem = np.lexsort((np.arange(len(lista)), -pontuacao))[:top_n]
+    return _formatar_recomendacoes(lista.iloc[ordem], indice['filmes'])
+
+
+# USUÁRIOS NOVOS (FOLD-IN)
+# Prepara, uma única vez, a matriz filmes x gêneros alinhada com as colunas do modelo
+def preparar_fold_in(df_filmes, colunas_generos):
+    incidencia, generos = construir_incidencia_generos(df_filmes)
+    colunas = pd.Index(generos).get_indexer(colunas_generos)
+    
+    alinhada = np.zeros((incidencia.shape[0], len(colunas_generos)))
+    presentes = colunas >= 0
+    alinhada[:, presentes] = incidencia[:, colunas[presentes]].toarray()
+    
+    return {'filmes': pd.Index(df_filmes['movieId']), 'incidencia': alinhada, 'generos': list(colunas_generos)}
+
+
+# Vetor de proporção de gêneros a partir de pares (movieId, nota), com a mesma
+# regra de carregar_dados: só contam notas >= 3.0 e filmes do catálogo
+def vetor_proporcao(avaliacoes, preparo):
+    avaliacoes = np.asarray(avaliacoes, dtype=np.float64).reshape(-1, 2)
+    linhas = preparo['filmes'].get_indexer(avaliacoes[:, 0].astype(np.int64))
+    bons = (linhas >= 0) & (avaliacoes[:, 1] >= 3.0)
+    
+    contagem = preparo['incidencia'][linhas[bons]].sum(axis=0)
+    total = contagem.sum()
+    return contagem / total if total > 0 else contagem
+
+
+# Atribui um usuário que não está no modelo a um cluster (sem retreinar nem
+# recalcular as tabelas)
+def atribuir_cluster_novo_usuario(avaliacoes, modelo, preparo):
+    vetor = vetor_proporcao(avaliacoes, preparo)
+    # Mesmo critério do KMeans.predict (centróide mais próximo), sem o custo de validação do sklearn
+    return int(np.argmin(((modelo.cluster_centers_ - vetor) ** 2).sum(axis=1)))
+
+
+# Recomenda a partir do ranking de um cluster já atribuído, sem os filmes avaliados
+def recomendar_do_cluster(avaliacoes, cluster, indice, top_n=5):
+    vistos = np.unique(np.asarray(avaliacoes, dtype=np.float64).reshape(-1, 2)[:, 0].astype(np.int64))
+    return _servir_do_ranking(indice, cluster, vistos, top_n)
+
+
+def recomendar_para_novo_usuario(avaliacoes, modelo, indice, preparo, top_n=5):
+    cluster = atribuir_cluster_novo_usuario(avaliacoes, modelo, preparo)
+    return cluster, recomendar_do_cluster(avaliacoes, cluster, indice, top_n)
+
+@instrumentar('obter_detalhes_cluster', linhas=lambda r: r[0])
 def obter_detalhes_cluster(cluster_alvo, df_clusters, df_ratings):
     qtd_usuarios = len(df_clusters[df_clusters['Cluster'] == cluster_alvo])
     dados_do_cluster = df_clusters[df_clusters['Cluster'] == cluster_alvo].drop(columns=['Cluster'])
@@ -75,6 +252,37 @@ def obter_detalhes_cluster(cluster_alvo, df_clusters, df_ratings):
     
     return qtd_usuarios, top_generos_cluster, media_filmes
 
+# Resumo de todos os clusters numa única passada agrupada (mesmos valores de
+# obter_detalhes_cluster + persona). Fica em cache junto com o modelo (df_clusters).
+@instrumentar('resumir_clusters', cache=st.cache_resource)
+def resumir_clusters(df_clusters, _df_ratings, k=None):
+    clusters = df_clusters['Cluster']
+    k = k if k is not None else int(clusters.max()) + 1
+    
+    populacao = clusters.value_counts().reindex(range(k), fill_value=0)
+    medias_generos = df_clusters.groupby('Cluster').mean().reindex(range(k))
+    
+    # Avaliações por usuário -> soma por cluster
+    avaliacoes_por_usuario = _df_ratings['userId'].value_counts()
+    avaliacoes_por_cluster = avaliacoes_por_usuario.reindex(df_clusters.index, fill_value=0).groupby(clusters.to_numpy()).sum()
+    avaliacoes_por_cluster = avaliacoes_por_cluster.reindex(range(k), fill_value=0)
+    
+    linhas = []
+    for cluster in range(k):
+        qtd_usuarios = int(populacao[cluster])
+        top_generos = medias_generos.loc[cluster].sort_values(ascending=False).head(3)
+        titulo, descricao = gerar_descricao_cluster(top_generos)
+        linhas.append({
+            'Cluster': cluster,
+            'populacao': qtd_usuarios,
+            'top_generos': top_generos,
+            'media_filmes': avaliacoes_por_cluster[cluster] / qtd_usuarios if qtd_usuarios > 0 else 0,
+            'persona': titulo,
+            'descricao': descricao,
+        })
+    
+    return pd.DataFrame(linhas).set_index('Cluster')
+
 # Gerar as personas do cluster
 def gerar_descricao_cluster(top_generos):
     if top_generos.empty:
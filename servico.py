@@ -0,0 +1,269 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+import pandas as pd
+import tornado.web
+
+import instrumentacao
+
+from artefatos import carregar_artefatos
+from data_processing import carregar_dados
+from indice_avaliacoes import IndiceAvaliacoes
+from ml_models import treinar_modelo
+from recommender import (ranquear_filmes, recomendar_filmes_indexado, gerar_relatorio,
+                         obter_detalhes_cluster, gerar_descricao_cluster, preparar_fold_in,
+                         atribuir_cluster_novo_usuario, recomendar_do_cluster)
+
+# SERVIÇO HTTP DE RECOMENDAÇÃO (SEM STREAMLIT)
+#
+#   GET /usuarios/<id>/recomendacoes?top_n=10
+#   GET /usuarios/<id>/perfil
+#   GET /clusters/<id>
+#   POST /novos-usuarios/recomendacoes  {"avaliacoes": [[movieId, nota], ...], "top_n": 10}
+#   GET /metricas            -> p50/p99 de latência por rota
+#   GET /metricas/prometheus -> etapas do pipeline no formato do Prometheus (*)
+#   GET /metricas/etapas     -> o mesmo em JSON (*)
+#   GET /perfis              -> perfis capturados com ?perfil=1 em qualquer rota (*)
+#
+# (*) só com RECOMENDACAO_INSTRUMENTACAO=1 (ver instrumentacao.py). O perfil por
+# amostragem cobre todas as threads do processo enquanto a requisição roda.
+#
+# O modelo é carregado uma única vez. O ranking de cada cluster é agregado sob
+# demanda, e requisições simultâneas para o mesmo cluster esperam a mesma
+# agregação em vez de repetir o trabalho.
+
+AMOSTRAS_LATENCIA = 10000
+
+
+class ServicoRecomendacao:
+
+    def __init__(self, diretorio='DataBase', k=5, motor='kmeans'):
+        self.movies, self.ratings, self.tabela_completa, tabela_proporcao = carregar_dados(diretorio)
+
+        artefatos = carregar_artefatos(self.movies, diretorio, k, motor)
+        if artefatos is not None:
+            self.modelo, self.df_clusters, _ = artefatos
+        else:
+            self.modelo, self.df_clusters = treinar_modelo(tabela_proporcao, k, motor=motor)
+
+        avaliacoes = self.tabela_completa[['userId', 'movieId', 'rating']]
+        self._avaliacoes = avaliacoes.assign(Cluster=avaliacoes['userId'].map(self.df_clusters['Cluster']))
+        self.indice = {
+            'cluster_do_usuario': self.df_clusters['Cluster'],
+            'ranking': {},
+            'vistos': avaliacoes.groupby('userId')['movieId'].unique(),
+            'filmes': self.movies,
+        }
+        self.indice_avaliacoes = IndiceAvaliacoes(self.ratings, self.movies)
+        self.preparo_fold_in = preparar_fold_in(self.movies, [c for c in self.df_clusters.columns if c != 'Cluster'])
+        self._em_andamento = {}
+        self._resultados = {}
+        self.latencias = defaultdict(lambda: deque(maxlen=AMOSTRAS_LATENCIA))
+
+    # Executa `funcao` uma vez por chave; quem chegar enquanto ela roda espera o mesmo resultado
+    async def _uma_vez(self, chave, funcao, *args):
+        if chave in self._resultados:
+            return self._resultados[chave]
+        if chave not in self._em_andamento:
+            loop = asyncio.get_running_loop()
+            self._em_andamento[chave] = loop.run_in_executor(None, funcao, *args)
+        try:
+            resultado = await asyncio.shield(self._em_andamento[chave])
+        finally:
+            self._em_andamento.pop(chave, None)
+        self._resultados[chave] = resultado
+        return resultado
+
+    def _ranking_cluster(self, cluster):
+        ranking = ranquear_filmes(self._avaliacoes[self._avaliacoes['Cluster'] == cluster])
+        return ranking.merge(self.movies[['movieId', 'title']], on='movieId', how='left')[
+            ['movieId', 'title', 'nota_media_cluster', 'contagem_avaliacoes']]
+
+    def _resumo_cluster(self, cluster):
+        qtd_usuarios, top_generos, media_filmes = obter_detalhes_cluster(cluster, self.df_clusters, self.ratings)
+        titulo, descricao = gerar_descricao_cluster(top_generos)
+        return {'cluster': cluster, 'persona': titulo, 'descricao': descricao, 'usuarios': qtd_usuarios,
+                'media_filmes_por_usuario': media_filmes, 'top_generos': top_generos.to_dict()}
+
+    async def recomendacoes(self, usuario, top_n=10):
+        if usuario not in self.df_clusters.index:
+            return None
+        cluster = int(self.df_clusters.at[usuario, 'Cluster'])
+        self.indice['ranking'][cluster] = await self._uma_vez(('ranking', cluster), self._ranking_cluster, cluster)
+        recomendacoes = recomendar_filmes_indexado(usuario, self.indice, top_n=top_n)
+        return {'userId': usuario, 'cluster': cluster, 'recomendacoes': recomendacoes.to_dict(orient='records')}
+
+    # Usuário que ainda não está no modelo: cluster previsto a partir das avaliações enviadas
+    async def recomendacoes_novo_usuario(self, avaliacoes, top_n=10):
+        cluster = atribuir_cluster_novo_usuario(avaliacoes, self.modelo, self.preparo_fold_in)
+        self.indice['ranking'][cluster] = await self._uma_vez(('ranking', cluster), self._ranking_cluster, cluster)
+        recomendacoes = recomendar_do_cluster(avaliacoes, cluster, self.indice, top_n)
+        return {'cluster': cluster, 'recomendacoes': recomendacoes.to_dict(orient='records')}
+
+    async def perfil(self, usuario, limite=20):
+        if usuario not in self.df_clusters.index:
+            return None
+        loop = asyncio.get_running_loop()
+        total, media, generos_top, top_filmes = await loop.run_in_executor(
+            None, gerar_relatorio, usuario, self.ratings, self.movies, self.indice_avaliacoes)
+        return {'userId': usuario, 'cluster': int(self.df_clusters.at[usuario, 'Cluster']),
+                'total_filmes': total, 'media_notas': media, 'generos': generos_top.to_dict(),
+                'top_filmes': top_filmes[['movieId', 'title', 'genres', 'rating']].head(limite).to_dict(orient='records')}
+
+    async def cluster(self, cluster):
+        if cluster not in set(self.df_clusters['Cluster'].unique().tolist()):
+            return None
+        return await self._uma_vez(('cluster', cluster), self._resumo_cluster, cluster)
+
+    def registrar_latencia(self, rota, segundos):
+        self.latencias[rota].append(segundos)
+
+    def metricas(self):
+        return {
+            rota: {'requisicoes': len(valores),
+                   'p50_ms': float(np.percentile(valores, 50) * 1000),
+                   'p99_ms': float(np.percentile(valores, 99) * 1000)}
+            for rota, valores in self.latencias.items() if valores
+        }
+
+
+# numpy/pandas -> tipos nativos do JSON
+def _para_json(valor):
+    if isinstance(valor, np.generic):
+        return valor.item()
+    if valor is pd.NA or (isinstance(valor, float) and np.isnan(valor)):
+        return None
+    return str(valor)
+
+
+class _Base(tornado.web.RequestHandler):
+
+    def initialize(self, servico, rota):
+        self.servico = servico
+        self.rota = rota
+
+    def prepare(self):
+        self._inicio = time.perf_counter()
+        self._perfil = None
+        if instrumentacao.ATIVA and self.get_argument('perfil', '0') == '1':
+            self._perfil = instrumentacao.AmostradorPerfil().iniciar()
+
+    def on_finish(self):
+        if self.rota is not None:
+            self.servico.registrar_latencia(self.rota, time.perf_counter() - self._inicio)
+        if self._perfil is not None:
+            instrumentacao.guardar_perfil(self._perfil.parar(), f'{self.request.method} {self.request.uri}')
+
+    def responder(self, conteudo):
+        if conteudo is None:
+            self.set_status(404)
+            conteudo = {'erro': 'não encontrado'}
+        self.set_header('Content-Type', 'application/json; charset=utf-8')
+        self.finish(json.dumps(conteudo, default=_para_json, ensure_ascii=False))
+
+    def erro_400(self, mensagem):
+        self.set_status(400)
+        self.responder({'erro': mensagem})
+
+
+# top_n precisa ser um inteiro >= 1 (ValueError/TypeError caso contrário)
+def _validar_top_n(valor):
+    if isinstance(valor, bool) or isinstance(valor, float) and not valor.is_integer():
+        raise TypeError('top_n deve ser inteiro')
+    top_n = int(valor)
+    if top_n < 1:
+        raise ValueError('top_n deve ser >= 1')
+    return top_n
+
+
+class Recomendacoes(_Base):
+    async def get(self, usuario):
+        try:
+            top_n = _validar_top_n(self.get_argument('top_n', '10'))
+        except (ValueError, TypeError):
+            self.erro_400('top_n inválido: esperado um inteiro >= 1')
+            return
+        self.responder(await self.servico.recomendacoes(int(usuario), top_n))
+
+
+class RecomendacoesNovoUsuario(_Base):
+    async def post(self):
+        try:
+            corpo = json.loads(self.request.body or b'{}')
+            if not isinstance(corpo, dict):
+                raise TypeError('o corpo deve ser um objeto JSON')
+            avaliacoes = [(int(filme), float(nota)) for filme, nota in corpo.get('avaliacoes', [])]
+            top_n = _validar_top_n(corpo.get('top_n', 10))
+        except (ValueError, TypeError):
+            self.erro_400('corpo inválido: esperado {"avaliacoes": [[movieId, nota], ...], "top_n": inteiro >= 1}')
+            return
+        self.responder(await self.servico.recomendacoes_novo_usuario(avaliacoes, top_n))
+
+
+class Perfil(_Base):
+    async def get(self, usuario):
+        self.responder(await self.servico.perfil(int(usuario)))
+
+
+class Cluster(_Base):
+    async def get(self, cluster):
+        self.responder(await self.servico.cluster(int(cluster)))
+
+
+class Metricas(_Base):
+    def get(self):
+        self.responder(self.servico.metricas())
+
+
+class MetricasPrometheus(_Base):
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.finish(instrumentacao.exportar_prometheus())
+
+
+class MetricasEtapas(_Base):
+    def get(self):
+        self.responder(instrumentacao.exportar_json())
+
+
+class Perfis(_Base):
+    def get(self):
+        self.responder(instrumentacao.listar_perfis())
+
+
+def criar_aplicacao(servico):
+    return tornado.web.Application([
+        (r'/usuarios/(-?\d+)/recomendacoes', Recomendacoes, {'servico': servico, 'rota': 'recomendacoes'}),
+        (r'/novos-usuarios/recomendacoes', RecomendacoesNovoUsuario, {'servico': servico, 'rota': 'novo_usuario'}),
+        (r'/usuarios/(-?\d+)/perfil', Perfil, {'servico': servico, 'rota': 'perfil'}),
+        (r'/clusters/(\d+)', Cluster, {'servico': servico, 'rota': 'cluster'}),
+        (r'/metricas', Metricas, {'servico': servico, 'rota': None}),
+        (r'/metricas/prometheus', MetricasPrometheus, {'servico': servico, 'rota': None}),
+        (r'/metricas/etapas', MetricasEtapas, {'servico': servico, 'rota': None}),
+        (r'/perfis', Perfis, {'servico': servico, 'rota': None}),
+    ])
+
+
+async def _executar(args):
+    servico = ServicoRecomendacao(args.diretorio, args.k, args.motor)
+    criar_aplicacao(servico).listen(args.porta, args.host)
+    print(f'Servindo recomendações em http://{args.host}:{args.porta}')
+    await asyncio.Event().wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serviço HTTP de recomendação (sem Streamlit).')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=8000)
+    parser.add_argument('--k', type=int, default=5, help='quantidade de clusters do K-Means')
+    parser.add_argument('--motor', default='kmeans', help='motor de treinamento (kmeans, minibatch, incremental)')
+    parser.add_argument('--diretorio', default='DataBase', help='pasta com movies.dat e ratings.dat')
+    asyncio.run(_executar(parser.parse_args(argv)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+import time
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# RE-RANQUEAMENTO POR VIZINHOS MAIS PRÓXIMOS DENTRO DO CLUSTER
+#
+# O ranking do cluster é o mesmo para todos os seus membros. Aqui os primeiros
+# candidatos desse ranking são reordenados pelo gosto dos k usuários mais
+# parecidos com o alvo (similaridade de cosseno entre vetores de proporção).
+#
+# O índice guarda, por cluster, os vetores normalizados (float32, contíguos). A
+# busca é um produto matriz-vetor em blocos de linhas com argpartition para o
+# top-k; entre blocos o tempo é conferido e, se o orçamento estourar, a busca
+# para com os melhores vizinhos encontrados até ali. O uso na recomendação fica
+# em recommender.recomendar_com_vizinhos.
+
+K_VIZINHOS = 50
+LINHAS_POR_BLOCO = 65536
+ORCAMENTO_MS = 50.0
+
+
+class IndiceVizinhos:
+
+    def __init__(self, df_clusters, matrizes):
+        generos = [g for g in df_clusters.columns if g != 'Cluster']
+        vetores = df_clusters[generos].to_numpy(dtype=np.float32)
+        normas = np.linalg.norm(vetores, axis=1, keepdims=True)
+        vetores = np.divide(vetores, normas, out=np.zeros_like(vetores), where=normas > 0)
+
+        self.posicao = pd.Index(df_clusters.index)
+        self.cluster = df_clusters['Cluster'].to_numpy()
+
+        # Linha de cada usuário do modelo na matriz de notas usuários x filmes
+        self.avaliacoes = matrizes.avaliacoes
+        self.linha_avaliacoes = pd.Index(matrizes.usuarios).get_indexer(df_clusters.index)
+        self.coluna_filme = pd.Index(matrizes.filmes)
+
+        # Por cluster: posições dos membros e seus vetores normalizados
+        self.membros = {}
+        self.vetores = {}
+        for cluster in np.unique(self.cluster):
+            membros = np.flatnonzero(self.cluster == cluster)
+            self.membros[int(cluster)] = membros
+            self.vetores[int(cluster)] = np.ascontiguousarray(vetores[membros])
+        self._vetor = vetores
+
+    # Top-k vizinhos do usuário dentro do cluster: (posições no df_clusters, similaridades)
+    def vizinhos(self, usuario, k=K_VIZINHOS, orcamento_ms=ORCAMENTO_MS, linhas_por_bloco=LINHAS_POR_BLOCO):
+        inicio = time.perf_counter()
+        posicao = self.posicao.get_loc(usuario)
+        cluster = int(self.cluster[posicao])
+        membros, vetores, alvo = self.membros[cluster], self.vetores[cluster], self._vetor[posicao]
+
+        melhores = np.zeros(0, dtype=np.int64)
+        similaridades = np.zeros(0, dtype=np.float32)
+        for bloco in range(0, len(membros), linhas_por_bloco):
+            sim = vetores[bloco:bloco + linhas_por_bloco] @ alvo
+            candidatos = np.arange(bloco, bloco + len(sim))
+            sem_alvo = membros[candidatos] != posicao
+            sim, candidatos = sim[sem_alvo], candidatos[sem_alvo]
+
+            # Junta com os melhores até aqui e fica só com o top-k
+            sim = np.concatenate([similaridades, sim])
+            candidatos = np.concatenate([melhores, candidatos])
+            if len(sim) > k:
+                topo = np.argpartition(-sim, k - 1)[:k]
+                sim, candidatos = sim[topo], candidatos[topo]
+            melhores, similaridades = candidatos, sim
+
+            if (time.perf_counter() - inicio) * 1000 > orcamento_ms:
+                break
+
+        ordem = np.argsort(-similaridades, kind='stable')
+        return membros[melhores[ordem]], similaridades[ordem]
+
+    # Afinidade de cada filme: média ponderada pela similaridade de (nota - 3) entre os
+    # vizinhos que avaliaram, em [-1, 1] (0 quando nenhum vizinho avaliou)
+    def afinidade(self, vizinhos, similaridades, filmes):
+        linhas = self.linha_avaliacoes[vizinhos]
+        validos = linhas >= 0
+        linhas, pesos = linhas[validos], np.maximum(similaridades[validos], 0).astype(np.float64)
+
+        colunas = self.coluna_filme.get_indexer(filmes)
+        notas = np.zeros((len(linhas), len(filmes)))
+        conhecidas = colunas >= 0
+        if len(linhas) and conhecidas.any():
+            notas[:, conhecidas] = self.avaliacoes[linhas][:, colunas[conhecidas]].toarray()
+
+        avaliaram = notas > 0
+        soma_pesos = pesos @ avaliaram
+        soma = pesos @ np.where(avaliaram, (notas - 3.0) / 2.0, 0.0)
+        return np.divide(soma, soma_pesos, out=np.zeros(len(filmes)), where=soma_pesos > 0)
+
+
+@st.cache_resource
+def construir_indice_vizinhos(df_clusters, _matrizes):
+    return IndiceVizinhos(df_clusters, _matrizes)
+